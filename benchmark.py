@@ -0,0 +1,142 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from import_data import Data, DataReaktor
+from linear_system import LinearSystem
+from measurement import Measurement
+from optimize import Optimizer
+from pulse_decay import estimate_parameters
+from settings import SolverConfig
+from synthetic import SyntheticMeasurement
+
+# the outlet starts above atmospheric pressure, so the pressures shifted by the sensor errors in the uncertainty
+# run stay positive
+cases = [{'name': 'HY_S01', 'reaktor': False, 'k': 2e-18, 'n': 0.1, 'pulse': 40, 'base_pressure': 10},
+         {'name': 'HY_RV1', 'reaktor': True, 'k': 5e-18, 'n': 0.05, 'pulse': 40, 'base_pressure': 10}]
+# a time is a regression if it is slower than the baseline by more than the relative tolerance and the timer
+# resolution, an error if it exceeds the baseline by more than its absolute tolerance (the forward error is
+# in %) or the limit
+time_tolerance = 0.25
+time_resolution = 0.01
+accuracy_tolerances = {'forward_error': 0.1, 'permeability_error': 0.005}
+maximum_permeability_error = 0.05
+
+
+def best_time(function, repeat):
+    # the fastest of several runs, the output of the solver is not printed
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def benchmark_case(directory, case, hours, config, repeat, uncertainty, workers):
+    measurement = SyntheticMeasurement(hours=hours, **case)
+    path = measurement.write(directory)
+    data_class = DataReaktor if case['reaktor'] else Data
+    data = data_class(path, config, interactive=False)
+    sample_data = data.sample_data()
+    results = {'name': case['name'], 'rows': measurement.duration + measurement.lead_time + 1}
+
+    results['parsing'], (df, _) = best_time(lambda: data.parse_raw_file(path), repeat)
+    data.read_measurement_file()
+    results['parsing_cached'], df = best_time(data.read_measurement_file, repeat)
+    with contextlib.redirect_stdout(io.StringIO()):
+        df_final = data.adjust_measurement_interval(data.convert_units(df.copy()))
+    results['interpolation'], df_100 = best_time(lambda: data.interpolate(df_final), repeat)
+
+    truth = [case['k'], case['n']]
+    results['forward_solve'], solution = best_time(
+        lambda: LinearSystem(df_100, sample_data, truth, config).solve_linear_system(), repeat)
+    optimizer = Optimizer(df_100, sample_data, truth, config)
+    optimizer.data = solution
+    results['forward_error'] = float(optimizer.calculate_error())
+
+    # the fit starts from the analytic estimate of k with the known porosity
+    guess = [estimate_parameters(df_100, sample_data)[0], case['n']]
+    optimizer = Optimizer(df_100.copy(), sample_data, guess, config)
+    results['fit'], (fit, _) = best_time(lambda: optimizer.nelder_mead('k'), 1)
+    results['fit_evaluations'] = int(fit.nfev)
+    results['permeability_error'] = float(abs(fit.x[0] / case['k'] - 1))
+
+    # the reaktor database has no sensor uncertainties, the uncertainty run is only possible for cores
+    if uncertainty and not case['reaktor']:
+        measurement = Measurement(path, config, interactive=False)
+        results['fit_batch'], _ = best_time(lambda: measurement.calculate_permeability_batch(guess, 'k'), 1)
+        # the uncertainty run starts from the interval and the result of the fit
+        measurement.save_adjusted_measurement_file()
+        results['uncertainty'], _ = best_time(lambda: measurement.calculate_uncertainty('k', workers), 1)
+    return results
+
+
+def find_regressions(results, baseline):
+    regressions = []
+    baseline = {case['name']: case for case in baseline['cases']}
+    for case in results['cases']:
+        if case['permeability_error'] > maximum_permeability_error:
+            regressions.append(f'{case["name"]}: permeability error {case["permeability_error"]:.2%} '
+                               f'above the limit of {maximum_permeability_error:.0%}')
+        reference = baseline.get(case['name'])
+        if reference is None:
+            continue
+        for key in ['parsing', 'parsing_cached', 'interpolation', 'forward_solve', 'fit', 'fit_batch',
+                    'uncertainty']:
+            if (key in case and key in reference
+                    and case[key] > reference[key] * (1 + time_tolerance) + time_resolution):
+                regressions.append(f'{case["name"]}: {key} {case[key]:.3f} s, baseline {reference[key]:.3f} s')
+        for key, tolerance in accuracy_tolerances.items():
+            if case[key] > reference[key] + tolerance:
+                regressions.append(f'{case["name"]}: {key} {case[key]:.4g}, baseline {reference[key]:.4g}')
+    return regressions
+
+
+def run_benchmarks(directory='benchmark_data', hours=48, config=SolverConfig(), repeat=3, uncertainty=False,
+                   workers=None, baseline=None, path_results=None):
+    results = {'time': pd.Timestamp.now().isoformat(timespec='seconds'),
+               'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+               'hours': hours, 'config': repr(config),
+               'cases': [benchmark_case(directory, case, hours, config, repeat, uncertainty, workers)
+                         for case in cases]}
+
+    print(pd.DataFrame(results['cases']).set_index('name').T.to_string(float_format='%.4g'))
+    if path_results is not None:
+        with open(path_results, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    reference = {'cases': []}
+    if baseline is not None:
+        with open(baseline) as file:
+            reference = json.load(file)
+        if reference['hours'] != hours or reference['config'] != repr(config):
+            print('The baseline was measured with other settings, only the accuracy limits are checked.')
+            reference['cases'] = []
+    regressions = find_regressions(results, reference)
+    for regression in regressions:
+        print(f'Regression {regression}')
+    return results, regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time parsing, interpolation, forward solve and fits on '
+                                                 'synthetic measurements with known k and n.')
+    parser.add_argument('--directory', default='benchmark_data', help='where the synthetic raw files are written')
+    parser.add_argument('--hours', type=float, default=48)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--uncertainty', action='store_true', help='also time the 17 fits of the uncertainty run')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--baseline', default=None, help='results of an earlier run to compare with')
+    parser.add_argument('--save', default=None, help='write the results to this json file')
+    args = parser.parse_args()
+    _, regressions = run_benchmarks(args.directory, args.hours, repeat=args.repeat, uncertainty=args.uncertainty,
+                                    workers=args.workers, baseline=args.baseline, path_results=args.save)
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,102 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+
+from measurement import Measurement, MeasurementReaktor
+from profiling import Profiler
+from sample_registry import SampleRegistry
+from settings import SolverConfig
+
+
+def find_raw_files(path_raw):
+    samples = {}
+    core_names, reaktor_names = SampleRegistry.get().names()
+    for names, reaktor in ((core_names, False), (reaktor_names, True)):
+        for name in names:
+            samples[name] = {'path': None, 'reaktor': reaktor}
+
+    for root, dirs, files in os.walk(path_raw):
+        for file in files:
+            name, extension = os.path.splitext(file)
+            if extension == '.txt' and name in samples and samples[name]['path'] is None:
+                samples[name]['path'] = os.path.join(root, file)
+    return {name: sample for name, sample in samples.items() if sample['path'] is not None}
+
+
+def fit_sample(path, reaktor, guess, parameter, config, profile=False, multi_start=False, error_budget=None,
+               multilevel=False):
+    measurement_class = MeasurementReaktor if reaktor else Measurement
+    measurement = measurement_class(path, config, interactive=False)
+    if multilevel:
+        fit = lambda: measurement.calculate_permeability_multilevel(guess, parameter, error_budget)
+    else:
+        # the samples already run in parallel, the starts of a multi-start fit run one after another
+        fit = lambda: measurement.calculate_permeability_batch(guess, parameter, multi_start, 1, error_budget)
+    if not profile:
+        result = fit()
+    else:
+        with Profiler(measurement.file_name) as profiler:
+            result = fit()
+        profiler.to_json(os.path.join(measurement.path_sim, measurement.file_name + '_profile.json'))
+    result.update({'name': measurement.file_name})
+    return result
+
+
+def read_results(path_results):
+    try:
+        return pd.read_csv(path_results)
+    except FileNotFoundError:
+        return pd.DataFrame({'name': []})
+
+
+def run_campaign(path_raw, path_results, guess=None, parameter='k', workers=None, config=SolverConfig(),
+                 profile=False, multi_start=False, error_budget=None, multilevel=False):
+    samples = find_raw_files(path_raw)
+    finished = set(read_results(path_results)['name'])
+    pending = {name: sample for name, sample in samples.items() if name not in finished}
+    print(f'{len(samples)} samples found, {len(samples) - len(pending)} already fitted, {len(pending)} to fit.')
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(fit_sample, sample['path'], sample['reaktor'], guess, parameter, config,
+                                   profile, multi_start, error_budget, multilevel): name
+                   for name, sample in pending.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                result = future.result()
+            except Exception as ex:
+                print(f'{name}: Exception {type(ex).__name__}, {ex.args}')
+                continue
+            # append every finished sample immediately, so an interrupted campaign can be resumed
+            df = pd.concat([read_results(path_results), pd.DataFrame([result])], ignore_index=True)
+            df = df[['name'] + [column for column in df.columns if column != 'name']]
+            df.to_csv(path_results, index=False, float_format='%.6g')
+            print(f'{name}: k = {result["k"]:.4} m^2, n = {result["n"]:.4}, e = {result["error"]:.3}')
+
+    return read_results(path_results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fit all samples of database.csv and database_reaktor.csv '
+                                                 'whose raw files are found in the raw data directory.')
+    parser.add_argument('path_raw')
+    parser.add_argument('path_results')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--parameter', choices=['k', 'both'], default='k')
+    parser.add_argument('--guess', type=float, nargs=2, default=None,
+                        help='k and n to start from, by default the analytic pulse-decay estimate')
+    parser.add_argument('--profile', action='store_true',
+                        help='write the timings and solver statistics of every fit to sim_data/<name>_profile.json')
+    fit = parser.add_mutually_exclusive_group()
+    fit.add_argument('--multi-start', action='store_true',
+                     help='fit in log10(k) from several starts around the guess')
+    fit.add_argument('--multilevel', action='store_true',
+                     help='fit on 25, 50 and 100 cells from coarse to fine and write the grid convergence index')
+    parser.add_argument('--error-budget', type=float, default=None,
+                        help='stop the simulation of candidates whose error exceeds this factor (at least 1) on '
+                             'the best error so far and every simplex value it is compared with, the path of the '
+                             'fit stays the same')
+    args = parser.parse_args()
+    run_campaign(args.path_raw, args.path_results, args.guess, args.parameter, args.workers, profile=args.profile,
+                 multi_start=args.multi_start, error_budget=args.error_budget, multilevel=args.multilevel)
@@ -0,0 +1,122 @@
+import os
+import threading
+import numpy as np
+import CoolProp.CoolProp as cp
+
+
+class PropertyError(ValueError):
+    # CoolProp cannot evaluate the gas properties, e.g. at the pressures of a non-physical candidate
+    pass
+
+
+def props_si(parameter, temperature, pressure, gas):
+    try:
+        return cp.PropsSI(parameter, 'T', temperature, 'P', pressure, gas)
+    except ValueError as ex:
+        raise PropertyError(*ex.args) from ex
+
+
+class PropertyTable:
+    parameter = ['ISOTHERMAL_COMPRESSIBILITY', 'VISCOSITY', 'DMASS']
+    minimum_pressure = 5e4
+    maximum_pressure = 5e7
+    initial_points = 1025
+    maximum_points = 16385
+    relative_tolerance = 1e-6
+    directory = 'property_tables'
+    tables = {}
+    lock = threading.Lock()
+
+    def __init__(self, gas, temperature):
+        self.gas = gas
+        self.temperature = temperature
+        self.pressure = None
+        self.values = None
+        self.exact = None
+        self.error = None
+        if not self.load_table():
+            self.build_table()
+            self.save_table()
+        self.step = self.pressure[1] - self.pressure[0]
+
+    @classmethod
+    def get(cls, gas, temperature):
+        key = (gas, round(float(temperature), 6))
+        with cls.lock:
+            if key not in cls.tables:
+                cls.tables[key] = cls(*key)
+            return cls.tables[key]
+
+    def lookup(self, pressure):
+        pressure = np.asarray(pressure, dtype=float)
+        position = (pressure - self.pressure[0]) / self.step
+        index = np.clip(position.astype(int), 0, len(self.pressure) - 2)
+        weight = position - index
+        result = self.values[:, index] * (1 - weight) + self.values[:, index + 1] * weight
+        # the table stores p*compressibility and density/p, which are smooth in p
+        result[0] = result[0] / pressure
+        result[2] = result[2] * pressure
+
+        fallback = (position < 0) | (position > len(self.pressure) - 1) | self.exact[index]
+        if fallback.any():
+            result[:, fallback] = self.props_si(pressure[fallback])
+        return result
+
+    def props_si(self, pressure):
+        return np.atleast_2d(props_si(self.parameter, self.temperature, pressure, self.gas)).T
+
+    def scaled_props_si(self, pressure):
+        values = self.props_si(pressure)
+        values[0] = values[0] * pressure
+        values[2] = values[2] / pressure
+        return values
+
+    def build_table(self):
+        pressure = np.linspace(self.minimum_pressure, self.maximum_pressure, self.initial_points)
+        values = self.scaled_props_si(pressure)
+        while True:
+            midpoints = (pressure[1:] + pressure[:-1]) / 2
+            midpoint_values = self.scaled_props_si(midpoints)
+            interpolated = (values[:, 1:] + values[:, :-1]) / 2
+            error = np.max(abs(interpolated - midpoint_values) / abs(midpoint_values), axis=0)
+            if error.max() <= self.relative_tolerance or len(pressure) >= self.maximum_points:
+                break
+            refined_pressure = np.empty(2 * len(pressure) - 1)
+            refined_pressure[0::2] = pressure
+            refined_pressure[1::2] = midpoints
+            refined_values = np.empty((len(values), len(refined_pressure)))
+            refined_values[:, 0::2] = values
+            refined_values[:, 1::2] = midpoint_values
+            pressure, values = refined_pressure, refined_values
+
+        # intervals that do not reach the tolerance (e.g. across a phase boundary) are evaluated exactly
+        self.exact = error > self.relative_tolerance
+        self.error = error[~self.exact].max(initial=0)
+        self.pressure = pressure
+        self.values = values
+
+    def file_path(self):
+        return os.path.join(self.directory, f'{self.gas}_{self.temperature:.6f}.npz')
+
+    def load_table(self):
+        try:
+            table = np.load(self.file_path())
+        except (OSError, ValueError):
+            return False
+        if (table['pressure'][0] != self.minimum_pressure or table['pressure'][-1] != self.maximum_pressure
+                or table['tolerance'] != self.relative_tolerance):
+            return False
+        self.pressure = table['pressure']
+        self.values = table['values']
+        self.exact = table['exact']
+        self.error = float(table['error'])
+        return True
+
+    def save_table(self):
+        os.makedirs(self.directory, exist_ok=True)
+        # write to a private file first, other processes may build the same table concurrently
+        temporary_path = f'{self.file_path()}.{os.getpid()}.{threading.get_ident()}'
+        with open(temporary_path, 'wb') as file:
+            np.savez(file, pressure=self.pressure, values=self.values, exact=self.exact,
+                     error=self.error, tolerance=self.relative_tolerance)
+        os.replace(temporary_path, self.file_path())
@@ -1,3 +1,6 @@
+import hashlib
+import io
+import json
 import os.path
 import numpy as np
 import pandas as pd
@@ -6,17 +9,29 @@ import datetime as dt
 import CoolProp.CoolProp as cp
 
 from plots import Plotter, PlotterReaktor
+from profiling import profiled
+from sample_registry import SampleRegistry
+from settings import SolverConfig
 
 
 class Data:
-    number_of_time_steps = 100
-
-    def __init__(self, path):
+    cache_directory = '.raw_cache'
+    cache_version = 2
+    signature_block_size = 65536
+    median_window = 5
+    minimum_confidence = 0.8
+    minimum_interval_points = 100
+    equilibrium_band = 3
+
+    def __init__(self, path, config=SolverConfig(), interactive=True):
         self.path = path
+        self.config = config
+        self.interactive = interactive
         self.file_name, _ = os.path.splitext(os.path.split(path)[1])
         self.path_raw, _ = os.path.splitext(os.path.split(path)[0])
         self.start = None
         self.stop = None
+        self.confidence = None
 
     @staticmethod
     def read_file(path):
@@ -26,11 +41,132 @@ class Data:
         except Exception as ex:
             print(f'Exception {type(ex).__name__}, {ex.args}')
 
+    @staticmethod
+    def parse_raw_file(path, offset=0):
+        # parse the complete lines from the byte offset on, a line the logger is still writing is left out
+        with open(path, 'rb') as file:
+            header = file.readline()
+            file.seek(max(offset, len(header)))
+            content = file.read()
+        end = content.rfind(b'\n') + 1
+        size = max(offset, len(header)) + end
+        # explicit dtypes, the date as category, so every distinct day is parsed once
+        columns = pd.read_csv(io.BytesIO(header), sep=' ').columns
+        dtype = {column: 'float64' for column in columns}
+        dtype.update({'Date': 'category', 'Time': str})
+        df = pd.read_csv(io.BytesIO(header + content[:end]), sep=' ', dtype=dtype)
+        df['DateTime'] = Data.parse_datetime(df['Date'], df['Time'])
+        df.drop(['Date', 'Time'], axis=1, inplace=True)
+        return df, size
+
+    @staticmethod
+    def parse_datetime(date, time):
+        date = date.astype('category')
+        days = pd.to_datetime(date.cat.categories, format='%d.%m.%Y').values
+        return days[date.cat.codes.values] + Data.parse_time_of_day(time)
+
+    @staticmethod
+    def parse_time_of_day(time):
+        # the logger writes HH:MM:SS, read the digits directly from the bytes
+        digits = np.asarray(time.values.astype('S8')).view(np.uint8).reshape(-1, 8).astype(np.int64) - ord('0')
+        separator = ord(':') - ord('0')
+        if not ((digits[:, [2, 5]] == separator).all() and (digits[:, [0, 1, 3, 4, 6, 7]] >= 0).all()
+                and (digits[:, [0, 1, 3, 4, 6, 7]] <= 9).all()):
+            return pd.to_timedelta(time).values
+        seconds = ((digits[:, 0] * 10 + digits[:, 1]) * 3600 + (digits[:, 3] * 10 + digits[:, 4]) * 60
+                   + digits[:, 6] * 10 + digits[:, 7])
+        return seconds.astype('timedelta64[s]')
+
+    @profiled('data_loading')
+    def read_measurement_file(self):
+        # the cache holds the parsed and deduplicated rows of the first index['size'] bytes of the raw file,
+        # a file that has only grown since is continued from there
+        df, index = self.load_raw_cache()
+        if df is not None and self.is_unchanged(index):
+            return df
+        if df is not None and self.is_appended(index):
+            new_df, size = self.parse_raw_file(self.path, index['size'])
+            if size == index['size']:
+                return df
+            new_df = self.drop_duplicates(new_df, index['last_datetime'])
+            df = pd.concat([df, new_df], ignore_index=True)
+            rows = index['rows'] + len(new_df)
+        else:
+            df, size = self.parse_raw_file(self.path)
+            if df.empty:
+                raise ValueError(f'{self.path} has no complete data line')
+            df = self.drop_duplicates(df)
+            rows = len(df)
+        last_datetime = df['DateTime'].values.astype('datetime64[ns]').astype(np.int64)[-1]
+        index = {'version': self.cache_version, 'size': size, 'mtime': os.stat(self.path).st_mtime_ns,
+                 'head': self.block_hash(0, min(size, self.signature_block_size)),
+                 'tail': self.tail_hash(size),
+                 'rows': rows, 'last_datetime': int(last_datetime)}
+        self.save_raw_cache(df, index)
+        return df
+
+    def block_hash(self, start, stop):
+        with open(self.path, 'rb') as file:
+            file.seek(start)
+            return hashlib.sha256(file.read(stop - start)).hexdigest()
+
+    def is_unchanged(self, index):
+        stat = os.stat(self.path)
+        return (stat.st_size == index['size'] and stat.st_mtime_ns == index['mtime']
+                and self.tail_hash(index['size']) == index['tail'])
+
+    def is_appended(self, index):
+        # size, the first and the last verified block, hashing multi-week logs completely would cost
+        # about as much as parsing them
+        return (os.path.getsize(self.path) >= index['size']
+                and self.block_hash(0, min(index['size'], self.signature_block_size)) == index['head']
+                and self.tail_hash(index['size']) == index['tail'])
+
+    def tail_hash(self, size):
+        return self.block_hash(max(size - self.signature_block_size, 0), size)
+
+    def raw_cache_path(self):
+        return os.path.join(os.path.dirname(self.path), self.cache_directory, self.file_name)
+
+    def load_raw_cache(self):
+        path = self.raw_cache_path()
+        try:
+            with open(os.path.join(path, 'index.json')) as file:
+                index = json.load(file)
+            if index['version'] != self.cache_version:
+                return None, None
+            # copy-on-write memory maps, the channels are only read from disk when they are used
+            columns = {column: np.load(os.path.join(path, column + '.npy'), mmap_mode='c')
+                       for column in index['columns']}
+        except (OSError, ValueError, KeyError):
+            return None, None
+        # copy=False keeps every channel in its own block on its memory map instead of consolidating them
+        # into one copied block
+        return pd.DataFrame(columns, copy=False), index
+
+    def save_raw_cache(self, df, index):
+        path = self.raw_cache_path()
+        index = dict(index, columns=list(df.columns))
+        try:
+            os.makedirs(path, exist_ok=True)
+            # the index is written last, an interrupted write leaves a cache that does not match it
+            if os.path.exists(os.path.join(path, 'index.json')):
+                os.remove(os.path.join(path, 'index.json'))
+            for column in df.columns:
+                np.save(os.path.join(path, column + '.npy'), np.asarray(df[column].values))
+            temporary_path = os.path.join(path, f'index.json.{os.getpid()}')
+            with open(temporary_path, 'w') as file:
+                json.dump(index, file)
+            os.replace(temporary_path, os.path.join(path, 'index.json'))
+        except OSError as ex:
+            print(f'Raw data cache not written, Exception {type(ex).__name__}, {ex.args}')
+
     @staticmethod
     def convert_units(df):
-        df['DateTime'] = pd.to_datetime(df['Date'] + df['Time'], format='%d.%m.%Y%X')
+        if 'DateTime' not in df:
+            df['DateTime'] = Data.parse_datetime(df['Date'], df['Time'])
+            df.drop(['Date', 'Time'], axis=1, inplace=True)
         df['Duration'] = pd.to_timedelta(df['DateTime'] - df['DateTime'][0]).dt.total_seconds()
-        df.drop(['Date', 'Time'], axis=1, inplace=True)
         df = df[['Duration', 'DateTime', 'Inlet_Pressure', 'Outlet_Pressure', 'Confining_Pressure', 'Temperature']]
         # convert bar (relative) to Pascal (absolute) and °C to K
         df[['Inlet_Pressure', 'Outlet_Pressure', 'Confining_Pressure']] = \
@@ -40,26 +176,60 @@ class Data:
 
     def adjust_measurement_interval(self, df):
         self.set_start_stop(df)
-        self.set_start_stop_manual(df)
+        if self.confidence < self.minimum_confidence:
+            print(f'{self.file_name}: measurement interval detected with low confidence {self.confidence:.2f}.')
+            if self.interactive:
+                self.set_start_stop_manual(df)
         df = df.iloc[self.start:self.stop]
         print(df.describe())
         df = self.reset_duration(df)
         return df
 
     def set_start_stop(self, df):
-        df['open'] = df['Inlet_Pressure'] < df['Inlet_Pressure'].max() * 0.98
-        try:
-            open = df.index[df['open'] == True].tolist()[0]
-            self.start = df.iloc[open:]['Inlet_Pressure'].idxmax()
-        except IndexError:
+        # the valve opens where the inlet pressure first falls 2 % below its maximum, the measurement starts
+        # at the pressure maximum from there on, or where the inlet starts to fall, and stops where the inlet
+        # has fallen to the outlet pressure within the noise, all on a running median so that single outliers
+        # do not move the interval
+        inlet = df['Inlet_Pressure'].rolling(self.median_window, center=True, min_periods=1).median().values
+        outlet = df['Outlet_Pressure'].rolling(self.median_window, center=True, min_periods=1).median().values
+
+        opened = inlet < inlet.max() * 0.98
+        if opened.any():
+            opening = np.argmax(opened)
+            self.start = opening + np.argmax(inlet[opening:])
+            # a file that begins with the inlet chamber already at the pulse pressure has no maximum after the
+            # opening, the 2 % have already been lost there; the measurement starts where the fall begins
+            noise = self.noise_level(df['Inlet_Pressure'].values)
+            while self.start > 0 and inlet[self.start - 1] > inlet[self.start] + 3 * noise:
+                self.start -= 1
+        else:
             self.start = 1
 
-        df['pressure_equilibrium'] = df['Inlet_Pressure'] <= df['Outlet_Pressure']
-        try:
-            self.stop = df.index[df['pressure_equilibrium'] == True].tolist()[0]
-        except:
+        # on noisy data the pressure difference scatters around zero in equilibrium instead of crossing it
+        # once, the equilibrium is reached within a few times the noise of the difference
+        noise = self.noise_level(df['Inlet_Pressure'].values - df['Outlet_Pressure'].values)
+        equilibrium = inlet[self.start:] - outlet[self.start:] <= self.equilibrium_band * noise
+        if equilibrium.any():
+            self.stop = self.start + np.argmax(equilibrium)
+        else:
             self.stop = len(df)
-        df.drop(['open', 'pressure_equilibrium'], axis=1, inplace=True)
+        self.confidence = self.interval_confidence(df, opened.any(), equilibrium)
+        return self.confidence
+
+    def interval_confidence(self, df, opened, equilibrium):
+        # 1 for a clean pulse, lower for a valve opening that was not found, a pulse that is small compared
+        # to the sensor noise, an equilibrium that is not kept or never reached and short intervals
+        inlet = df['Inlet_Pressure'].values
+        noise = self.noise_level(inlet)
+        pulse = inlet[self.start] - inlet[self.start:self.stop].min(initial=inlet[self.start])
+        signal_to_noise = pulse / (pulse + 10 * noise) if pulse > 0 else 0
+        kept = equilibrium[self.stop - self.start:].mean() if equilibrium.any() else 0
+        length = min(1, (self.stop - self.start) / self.minimum_interval_points)
+        return float(opened) * signal_to_noise * kept * length
+
+    @staticmethod
+    def noise_level(values):
+        return 1.4826 * np.median(abs(np.diff(values))) if len(values) > 1 else 0
 
     def set_start_stop_manual(self, df):
         while True:
@@ -96,10 +266,11 @@ class Data:
                      (A * (df['Outlet_Pressure']**2 - df['Inlet_Pressure']**2) * df['Duration'].diff()))
         return df
 
-    @staticmethod
-    def interpolate(df):
+    @profiled('interpolation')
+    def interpolate(self, df):
         start_date_in_seconds = (df['DateTime'] - dt.datetime(1970,1,1)).dt.total_seconds()[0] - 1
-        time_log_scale = np.geomspace(int(df['Duration'].min()), int(df['Duration'].max()), Data.number_of_time_steps).round(2)
+        time_log_scale = np.geomspace(int(df['Duration'].min()), int(df['Duration'].max()),
+                                      self.config.number_of_time_steps).round(2)
 
         function_inlet = interp1d(df['Duration'], df['Inlet_Pressure'])
         function_outlet = interp1d(df['Duration'], df['Outlet_Pressure'])
@@ -126,24 +297,30 @@ class Data:
         return df
 
     def new_pressure_file(self):
-        df = self.read_file(self.path)
-        df = self.drop_duplicates(df)
+        df = self.read_measurement_file()
         df = self.convert_units(df)
         df_final = self.adjust_measurement_interval(df)
         df_final_100 = self.interpolate(df_final)
         return df_final_100, df_final
 
+    @profiled('data_loading')
     def adjusted_pressure_file(self):
         df_final = pd.read_csv(os.path.join(self.path_raw, self.file_name + '_adjusted.csv'), parse_dates=['DateTime'])
         df_final_100 = self.interpolate(df_final)
         return df_final_100, df_final
 
-    def drop_duplicates(self, df):
-        rows = len(df)
-        df.drop_duplicates(ignore_index=True, inplace=True)
-        if rows > len(df):
-            df.to_csv(self.path, sep=' ', index=False)
-            print(f'Dropped {rows-len(df)} duplicate rows.')
+    @staticmethod
+    def drop_duplicates(df, last_datetime=None):
+        # the logger writes rows in time order, a row that is not newer than all rows before it
+        # (including the already verified part of the file) is a repeated line
+        datetime = df['DateTime'].values.astype('datetime64[ns]').astype(np.int64)
+        if last_datetime is None:
+            last_datetime = np.iinfo(np.int64).min
+        previous = np.maximum.accumulate(np.concatenate([[last_datetime], datetime[:-1]]))
+        keep = datetime > previous
+        if not keep.all():
+            df = df[keep].reset_index(drop=True)
+            print(f'Dropped {len(keep) - len(df)} duplicate rows.')
         return df
 
     def sample_data(self):
@@ -153,49 +330,38 @@ class Data:
                         'outlet_chamber_volume': unit[1]})
         return my_dict
 
+    def get_sample(self):
+        return SampleRegistry.get().core(self.file_name)
+
     def get_core_dimensions(self):
-        database = self.read_file('database.csv')
-        database.set_index('name', inplace=True)
-
-        length = database.loc[self.file_name, 'length']
-        diameter = database.loc[self.file_name, 'diameter']
-        area = np.pi * 0.25 * diameter**2
-        gas = database.loc[self.file_name, 'gas']
-        inlet, outlet = self.get_uncertainties(database)
-        my_dict = {'length': length,
-                   'diameter': diameter,
-                   'area': area,
-                   'gas': gas,
-                   'inlet_sensor': inlet,
-                   'outlet_sensor': outlet}
+        sample = self.get_sample()
+        my_dict = {'length': sample.length,
+                   'diameter': sample.diameter,
+                   'area': sample.area,
+                   'gas': sample.gas,
+                   'inlet_sensor': self.get_uncertainty(sample.inlet_sensor),
+                   'outlet_sensor': self.get_uncertainty(sample.outlet_sensor)}
         return my_dict
 
     def get_unit_dimensions(self):
-        database = self.read_file('database.csv')
-        units = self.read_file('measurement_units.csv')
-        ml_to_m3 = 1e-6
+        unit = SampleRegistry.get().unit(self.get_sample().unit)
+        return np.array([unit.inlet_chamber_volume, unit.outlet_chamber_volume])
 
-        database.set_index('name', inplace=True)
-        unit = database.loc[self.file_name, 'unit']
-        filt = units['number'] == unit
-        volume = units.loc[filt, ['inlet_chamber_in_ml', 'outlet_chamber_in_ml']]
-        return volume.values[0] * ml_to_m3
-
-    def get_uncertainties(self, database):
-        inlet = database.loc[self.file_name, 'uncertainty_inlet']
-        outlet = database.loc[self.file_name, 'uncertainty_outlet']
-        inlet = {'range': float(inlet.split('*')[0]), 'error': float(inlet.split('*')[1])}
-        outlet = {'range': float(outlet.split('*')[0]), 'error': float(outlet.split('*')[1])}
-        return inlet, outlet
+    @staticmethod
+    def get_uncertainty(sensor):
+        if sensor is None:
+            return None
+        return {'range': sensor.range, 'error': sensor.error}
 
 
 class DataReaktor(Data):
 
     @staticmethod
     def convert_units(df):
-        df['DateTime'] = pd.to_datetime(df['Date'] + df['Time'], format='%d.%m.%Y%X')
+        if 'DateTime' not in df:
+            df['DateTime'] = Data.parse_datetime(df['Date'], df['Time'])
+            df.drop(['Date', 'Time'], axis=1, inplace=True)
         df['Duration'] = pd.to_timedelta(df['DateTime'] - df['DateTime'][0]).dt.total_seconds()
-        df.drop(['Date', 'Time'], axis=1, inplace=True)
         df = df[['Duration', 'DateTime', 'Inlet_Pressure', 'Outlet_Pressure', 'Confining_Pressure_Reactor',
                  'Confining_Pressure_Sample', 'Temperature']]
         # convert bar (relative) to Pascal (absolute) and °C to K
@@ -212,10 +378,10 @@ class DataReaktor(Data):
                            'Ende der Messung angeben (start, ende)')
         return user_input
 
-    @staticmethod
-    def interpolate(df):
+    @profiled('interpolation')
+    def interpolate(self, df):
         start_date_in_seconds = (df['DateTime'] - dt.datetime(1970,1,1)).dt.total_seconds()[0] - 1
-        time_log_scale = np.geomspace(1, int(df['Duration'].max()), 100).round(2)
+        time_log_scale = np.geomspace(1, int(df['Duration'].max()), self.config.number_of_time_steps).round(2)
 
         function_inlet = interp1d(df['Duration'], df['Inlet_Pressure'])
         function_outlet = interp1d(df['Duration'], df['Outlet_Pressure'])
@@ -236,37 +402,20 @@ class DataReaktor(Data):
         df['DateTime'] = pd.to_datetime(df['Duration']+start_date_in_seconds, unit='s')
         return df
 
+    @profiled('data_loading')
     def adjusted_pressure_file(self):
         df_final = pd.read_csv(os.path.join(self.path_raw, self.file_name + '_adjusted.csv'), parse_dates=['DateTime'])
         df_final_100 = self.interpolate(df_final)
         return df_final_100, df_final
 
+    def get_sample(self):
+        return SampleRegistry.get().reaktor(self.file_name)
+
     def get_core_dimensions(self):
-        database = self.read_file('database_reaktor.csv')
-        database.set_index('name', inplace=True)
-
-        length = database.loc[self.file_name, 'length']
-        outer_diameter = database.loc[self.file_name, 'outer_diameter']
-        inner_diameter = database.loc[self.file_name, 'inner_diameter']
-        area = np.pi * 0.25 * (outer_diameter**2 - inner_diameter**2)
-        gas = database.loc[self.file_name, 'gas']
-        my_dict = {'length': length,
-                   'outer_diameter': outer_diameter,
-                   'inner_diameter': inner_diameter,
-                   'area': area,
-                   'gas': gas}
+        sample = self.get_sample()
+        my_dict = {'length': sample.length,
+                   'outer_diameter': sample.outer_diameter,
+                   'inner_diameter': sample.inner_diameter,
+                   'area': sample.area,
+                   'gas': sample.gas}
         return my_dict
-
-    def get_unit_dimensions(self):
-        database = self.read_file('database_reaktor.csv')
-        units = self.read_file('measurement_units.csv')
-        ml_to_m3 = 1e-6
-
-        database.set_index('name', inplace=True)
-        unit = database.loc[self.file_name, 'unit']
-        filt = units['number'] == unit
-        volume = units.loc[filt, ['inlet_chamber_in_ml', 'outlet_chamber_in_ml']]
-        return volume.values[0] * ml_to_m3
-
-
-
@@ -1,15 +1,16 @@
+import dataclasses
 import numpy as np
 import scipy.sparse
 import scipy.sparse.linalg
-import CoolProp.CoolProp as cp
-from import_data import Data
-import settings
+from gas_properties import PropertyTable, props_si
+from profiling import profiled
+import tridiagonal
+from settings import SolverConfig
 
 
 class LinearSystem:
-    number_of_cells = 50
 
-    def __init__(self, df_100, sample_data, guess):
+    def __init__(self, df_100, sample_data, guess, config=SolverConfig()):
         self.data = {'inlet_pressure': np.array(df_100['Inlet_Pressure'].values),
                      'outlet_pressure': np.array(df_100['Outlet_Pressure'].values),
                      'duration': np.array(df_100['Duration'].values),
@@ -18,33 +19,186 @@ class LinearSystem:
         self.guess = {'permeability': guess[0],
                       'porosity': guess[1]}
         self.sample = sample_data
+        self.config = config
+        self.batch_shape = np.shape(guess[0])
+        self.older_pressure = None
+        self.cell_widths = self.get_cell_widths()
+        self.workspace = self.prepare_workspace()
 
-    def solve_linear_system(self):
+    @profiled('forward_solve')
+    def solve_linear_system(self, start=None, error_budget=None):
+        # start is the end state of a simulation on a shorter window of the same time grid (PrefixStore),
+        # which is continued instead of solved from t = 0; the cell pressures of its earlier levels are
+        # not kept, so they are NaN in the history of the continued simulation; with an error budget (in % as Optimizer.calculate_error) the simulation stops as soon as the misfit
+        # of the time levels simulated so far exceeds it, only with fixed time steps
         number_of_timesteps = len(self.data['duration']) - 1
         self.calculate_timesteps()
         self.initialize_calculated_pressure()
+        self.data['aborted'] = False
         sample_pressure = self.get_initial_pressure()
+        pressure_history = np.empty(self.batch_shape + (number_of_timesteps + 1, self.config.number_of_cells))
+        pressure_history[..., 0, :] = sample_pressure
+        iterations = np.zeros(number_of_timesteps, dtype=int)
+        converged = np.zeros(self.batch_shape + (number_of_timesteps,), dtype=bool)
 
-        for step in range(number_of_timesteps):
+        if self.config.time_stepping == 'adaptive':
+            return self.solve_adaptive(sample_pressure)
+
+        first_step = 0
+        if start is not None and self.is_prefix(start):
+            first_step = len(start['duration']) - 1
+            for name in ['inlet_pressure_calculated', 'outlet_pressure_calculated']:
+                self.data[name][..., :first_step+1] = start[name]
+            pressure_history[..., :first_step+1, :] = np.nan
+            pressure_history[..., first_step+1-start['end_pressure'].shape[-2]:first_step+1, :] = \
+                start['end_pressure']
+            iterations[:first_step] = start['iterations']
+            converged[..., :first_step] = start['converged']
+            sample_pressure = pressure_history[..., first_step, :].copy()
+
+        if error_budget is not None:
+            misfit_limit = self.get_misfit_limit(error_budget)
+            misfit = self.squared_misfit(slice(0, first_step + 1))
+
+        for step in range(first_step, number_of_timesteps):
             self.data.update({'actual_time_step': step})
-            sample_pressure = self.iterate_nonlinear_parameters(sample_pressure)
-            self.data['inlet_pressure_calculated'][step+1] = sample_pressure[0]
-            self.data['outlet_pressure_calculated'][step+1] = sample_pressure[-1]
+            self.older_pressure = pressure_history[..., step-1, :] if step > 0 else None
+            sample_pressure, iterations[step], converged[..., step] = self.iterate(sample_pressure)
+            self.data['inlet_pressure_calculated'][..., step+1] = sample_pressure[..., 0]
+            self.data['outlet_pressure_calculated'][..., step+1] = sample_pressure[..., -1]
+            pressure_history[..., step+1, :] = sample_pressure
+            if error_budget is not None:
+                misfit += self.squared_misfit(slice(step + 1, step + 2))
+                if np.all(misfit > misfit_limit):
+                    return self.store_aborted_solution(step + 1, pressure_history, iterations, converged)
+
+        return self.store_solution(pressure_history, iterations, converged)
+
+    def get_misfit_limit(self, error_budget):
+        magnitude = np.sum(self.data['inlet_pressure']**2)
+        if self.sample['outlet_chamber_volume'] != 0:
+            magnitude += np.sum(self.data['outlet_pressure']**2)
+        return (error_budget / 100)**2 * magnitude
+
+    def squared_misfit(self, levels):
+        # the misfit never decreases with further time levels, so it bounds the error of the whole measurement
+        difference = abs(self.data['inlet_pressure'][levels] - self.data['inlet_pressure_calculated'][..., levels])
+        if self.sample['outlet_chamber_volume'] != 0:
+            difference += abs(self.data['outlet_pressure'][levels]
+                              - self.data['outlet_pressure_calculated'][..., levels])
+        return np.sum(difference**2, axis=-1)
+
+    def store_aborted_solution(self, level, pressure_history, iterations, converged):
+        # the calculated pressures end at the last simulated time level
+        for name in ['inlet_pressure_calculated', 'outlet_pressure_calculated']:
+            self.data[name] = self.data[name][..., :level+1]
+        self.data['aborted'] = True
+        return self.store_solution(pressure_history[..., :level+1, :], iterations[:level], converged[..., :level])
+
+    def solve_adaptive(self, sample_pressure):
+        # BDF2 on its own time levels; the local error is that of a backward Euler step, the difference between
+        # the BDF2 and the backward Euler level of the same step, which to leading order is dt / (dt + dt_old)
+        # times the difference of the BDF2 level to the linear extrapolation of the last two levels, so the
+        # backward Euler level is never solved for; the first step has no older level and is estimated by step
+        # doubling; a PI controller sets the next step, the pressures are interpolated linearly onto the
+        # measurement times afterwards
+        duration = self.data['duration']
+        scale = abs(self.data['inlet_pressure'][0] - self.data['outlet_pressure'][0])
+        minimum_time_step = (duration[-1] - duration[0]) * 1e-9
+        times = [duration[0]]
+        levels = [sample_pressure]
+        timesteps = []
+        iterations = []
+        converged = []
+        self.data.update({'timesteps': timesteps})
+
+        # a larger first step fails at the pressure jump at the inlet face, whose error hardly decreases with
+        # the step, the controller grows the steps quickly afterwards
+        dt = duration[1] - duration[0]
+        last_error = 1
+        while times[-1] < duration[-1]:
+            dt = min(dt, duration[-1] - times[-1])
+            timesteps.append(dt)
+            self.data.update({'actual_time_step': len(timesteps) - 1})
+            if len(levels) > 1:
+                self.older_pressure = levels[-2]
+                predicted = levels[-1] + (levels[-1] - levels[-2]) * dt / timesteps[-2]
+                sample_pressure, step_iterations, step_converged = self.iterate(levels[-1], predicted)
+                error = dt / (dt + timesteps[-2]) * (sample_pressure - predicted)
+            else:
+                full, full_iterations, full_converged = self.iterate(levels[-1])
+                timesteps[-1] = dt / 2
+                half, half_iterations, half_converged = self.iterate(levels[-1], (levels[-1] + full) / 2)
+                sample_pressure, step_iterations, step_converged = self.iterate(half, full)
+                timesteps[-1] = dt
+                step_iterations += full_iterations + half_iterations
+                step_converged = step_converged & full_converged & half_converged
+                error = sample_pressure - full
+            error = max(np.max(np.sqrt(np.mean(error**2, axis=-1))) / scale / self.config.time_step_tolerance, 1e-10)
+
+            if (error > 1 or not np.all(step_converged)) and dt > minimum_time_step:
+                timesteps.pop()
+                dt = dt * max(0.2, 0.9 / np.sqrt(error)) if np.all(step_converged) else dt / 2
+                continue
+            times.append(times[-1] + dt)
+            levels.append(sample_pressure)
+            iterations.append(step_iterations)
+            converged.append(step_converged)
+            dt = dt * min(10, 0.9 * error**-0.35 * last_error**0.2)
+            last_error = error
+
+        levels = np.stack(levels, axis=-2)
+        times = np.array(times)
+        index = np.clip(np.searchsorted(times, duration), 1, len(times) - 1)
+        weight = ((duration - times[index-1]) / (times[index] - times[index-1]))[:, np.newaxis]
+        pressure_history = levels[..., index-1, :] * (1 - weight) + levels[..., index, :] * weight
+        self.data['inlet_pressure_calculated'] = pressure_history[..., 0]
+        self.data['outlet_pressure_calculated'] = pressure_history[..., -1]
+        self.data.update({'timesteps': np.array(timesteps), 'internal_duration': times})
+        return self.store_solution(pressure_history, np.array(iterations), np.stack(converged, axis=-1))
 
-        self.data.update({'cell_pressure': sample_pressure})
+    def store_solution(self, pressure_history, iterations, converged):
+        self.data.update({'cell_pressure': pressure_history[..., -1, :],
+                          'cell_pressure_history': pressure_history,
+                          'iterations': iterations,
+                          'converged': converged})
+        if not converged.all():
+            print(f'{np.count_nonzero(~converged)} of {converged.size} time steps did not converge '
+                  f'within {self.config.maximum_iterations} {self.config.nonlinear_solver} iterations.')
         return self.data
 
+    @profiled('nonlinear_iteration')
+    def iterate(self, sample_pressure, initial_guess=None):
+        if self.config.nonlinear_solver == 'newton':
+            return self.iterate_newton(sample_pressure, initial_guess)
+        return self.iterate_nonlinear_parameters(sample_pressure, initial_guess)
+
+    def is_prefix(self, start):
+        # a simulation under the same conditions on a window that ends on a time of this grid
+        length = len(start['duration'])
+        return (length <= len(self.data['duration'])
+                and np.array_equal(start['duration'], self.data['duration'][:length])
+                and start['conditions'] == self.get_conditions()
+                and start['end_pressure'].shape[-1] == self.config.number_of_cells)
+
+    def get_conditions(self):
+        # the initial pressures and the temperature the gas properties are evaluated at, which is that of
+        # the shared property table (rounded to 1e-6 K) with the table backend
+        property_table = self.workspace['property_table']
+        temperature = self.workspace['temperature'] if property_table is None else property_table.temperature
+        return (float(self.data['inlet_pressure'][0]), float(self.data['outlet_pressure'][0]), float(temperature))
+
     def get_initial_pressure(self):
         atmospheric_pressure = self.data['outlet_pressure'][0]
-        sample_pressure = np.ones(self.number_of_cells) * atmospheric_pressure
-        sample_pressure[0] = self.data['inlet_pressure'][0]
+        sample_pressure = np.ones(self.batch_shape + (self.config.number_of_cells,)) * atmospheric_pressure
+        sample_pressure[..., 0] = self.data['inlet_pressure'][0]
         return sample_pressure
 
     def initialize_calculated_pressure(self):
-        inlet_pressure_calculated = np.ones(Data.number_of_time_steps)
-        inlet_pressure_calculated[0] = self.data['inlet_pressure'][0]
-        outlet_pressure_calculated = np.ones(Data.number_of_time_steps)
-        outlet_pressure_calculated[0] = self.data['outlet_pressure'][0]
+        inlet_pressure_calculated = np.ones(self.batch_shape + (len(self.data['duration']),))
+        inlet_pressure_calculated[..., 0] = self.data['inlet_pressure'][0]
+        outlet_pressure_calculated = np.ones(self.batch_shape + (len(self.data['duration']),))
+        outlet_pressure_calculated[..., 0] = self.data['outlet_pressure'][0]
         self.data.update({'inlet_pressure_calculated': inlet_pressure_calculated,
                           'outlet_pressure_calculated': outlet_pressure_calculated})
 
@@ -52,16 +206,18 @@ class LinearSystem:
         timesteps = np.diff(self.data['duration'])
         self.data.update({'timesteps': timesteps})
 
-    def iterate_nonlinear_parameters(self, sample_pressure):
+    def iterate_nonlinear_parameters(self, sample_pressure, initial_guess=None):
         i = 0
         difference = 1
         #difference_list = []
         #residuum_list = []
 
-        _, solution_vector = self.get_linear_system(sample_pressure)
-        while difference > 1e-5 and i <= 10:
+        solution_vector = self.get_right_hand_side(sample_pressure)
+        if initial_guess is not None:
+            sample_pressure = initial_guess
+        while np.max(difference) > self.config.nonlinear_tolerance and i < self.config.maximum_iterations:
             coefficient_matrix, _ = self.get_linear_system(sample_pressure)
-            sample_pressure_new = scipy.sparse.linalg.spsolve(coefficient_matrix, solution_vector)
+            sample_pressure_new = self.solve(coefficient_matrix, solution_vector)
             difference = self.l2_norm(sample_pressure_new, sample_pressure)
             #residuum = self.residuum(coefficient_matrix, sample_pressure, solution_vector)
             sample_pressure = sample_pressure_new
@@ -69,65 +225,276 @@ class LinearSystem:
             #difference_list.append(difference)
             #residuum_list.append(residuum)
 
-        return sample_pressure
+        return sample_pressure, i, difference <= self.config.nonlinear_tolerance
+
+    def iterate_newton(self, sample_pressure, initial_guess=None):
+        i = 0
+        difference = 1
+
+        solution_vector = self.get_right_hand_side(sample_pressure)
+        if initial_guess is not None:
+            sample_pressure = initial_guess
+        while np.max(difference) > self.config.nonlinear_tolerance and i < self.config.maximum_iterations:
+            residual, jacobian = self.get_newton_system(sample_pressure, solution_vector)
+            correction = self.solve(jacobian, -residual)
+            sample_pressure_new = sample_pressure + correction
+            difference = self.l2_norm(sample_pressure_new, sample_pressure)
+            sample_pressure = sample_pressure_new
+            i += 1
+
+        return sample_pressure, i, difference <= self.config.nonlinear_tolerance
+
+    @profiled('assembly')
+    def get_newton_system(self, sample_pressure, solution_vector):
+        residual, lower_diagonal, main_diagonal, upper_diagonal = \
+            self.get_newton_diagonals(sample_pressure, solution_vector)
+        return residual, self.assemble(lower_diagonal, main_diagonal, upper_diagonal)
+
+    def get_newton_diagonals(self, sample_pressure, solution_vector):
+        compressibility, viscosity, density, compressibility_derivative, viscosity_derivative, density_derivative = \
+            self.get_property_derivatives(sample_pressure)
+        off_diagonal, storage = self.build_coefficients(compressibility, viscosity, density)
+        storage_weight, flux_weight, _ = self.get_time_weights()
+        off_diagonal = flux_weight * off_diagonal
+        storage = storage_weight * storage
+
+        viscosity_mean = (viscosity[..., 1:] + viscosity[..., :-1]) / 2
+        density_mean = (density[..., 1:] + density[..., :-1]) / 2
+        off_diagonal_left = off_diagonal * (density_derivative[..., :-1] / density_mean
+                                            - viscosity_derivative[..., :-1] / viscosity_mean) / 2
+        off_diagonal_right = off_diagonal * (density_derivative[..., 1:] / density_mean
+                                             - viscosity_derivative[..., 1:] / viscosity_mean) / 2
+        storage_derivative = storage * (compressibility_derivative / compressibility + density_derivative / density)
+
+        pressure_difference = sample_pressure[..., 1:] - sample_pressure[..., :-1]
+        flux = off_diagonal * pressure_difference
+        residual = - storage * sample_pressure - solution_vector
+        residual[..., :-1] += flux
+        residual[..., 1:] -= flux
+
+        main_diagonal = - storage - storage_derivative * sample_pressure
+        main_diagonal[..., :-1] += - off_diagonal + off_diagonal_left * pressure_difference
+        main_diagonal[..., 1:] += - off_diagonal - off_diagonal_right * pressure_difference
+        upper_diagonal = off_diagonal + off_diagonal_right * pressure_difference
+        lower_diagonal = off_diagonal - off_diagonal_left * pressure_difference
+
+        return residual, lower_diagonal, main_diagonal, upper_diagonal
+
+    def get_property_derivatives(self, sample_pressure):
+        compressibility, viscosity, density = self.get_coolprop_data(sample_pressure)
+        # d(density)/dp = density * compressibility by definition, the others by a forward difference
+        perturbation = sample_pressure * 1e-6
+        compressibility_perturbed, viscosity_perturbed, _ = self.get_coolprop_data(sample_pressure + perturbation)
+        density_derivative = density * compressibility / self.config.compressibility_multiplier
+        compressibility_derivative = (compressibility_perturbed - compressibility) / perturbation
+        viscosity_derivative = (viscosity_perturbed - viscosity) / perturbation
+        return compressibility, viscosity, density, compressibility_derivative, viscosity_derivative, density_derivative
+
+    def calculate_gradient(self, pressure_gradient):
+        # discrete adjoint of the implicit scheme; pressure_gradient holds d(objective)/d(cell pressure)
+        # for every stored time level and the result is d(objective)/d(ln k, n)
+        if self.config.time_stepping != 'fixed' or self.config.time_integration != 'backward_euler':
+            raise ValueError('The adjoint gradient is only implemented for backward Euler with fixed time steps.')
+        pressure_history = self.data['cell_pressure_history']
+        number_of_timesteps = len(self.data['timesteps'])
+        k = self.workspace['permeability']
+        n = self.workspace['porosity']
+        sample_cells = np.ones(self.config.number_of_cells)
+        sample_cells[0] = sample_cells[-1] = 0
+        dx = self.cell_widths
+        k_mean_derivative = (sample_cells[:-1]*dx[:-1]*k[1:] + sample_cells[1:]*dx[1:]*k[:-1]) \
+            / (dx[:-1]*k[1:] + dx[1:]*k[:-1])
+        porosity_derivative = sample_cells / n
+
+        gradient = np.zeros(2)
+        adjoint = np.zeros(self.config.number_of_cells)
+        for step in range(number_of_timesteps - 1, -1, -1):
+            sample_pressure_old = pressure_history[step]
+            sample_pressure = pressure_history[step+1]
+            self.data.update({'actual_time_step': step})
+            rhs = - pressure_gradient[step+1]
+            if step < number_of_timesteps - 1:
+                rhs = rhs - self.get_storage_derivative(sample_pressure) * adjoint
+
+            _, solution_vector = self.get_linear_system(sample_pressure_old)
+            _, lower_diagonal, main_diagonal, upper_diagonal = \
+                self.get_newton_diagonals(sample_pressure, solution_vector)
+            adjoint = self.solve(self.assemble(upper_diagonal, main_diagonal, lower_diagonal), rhs)
+
+            compressibility, viscosity, density = self.get_coolprop_data(sample_pressure)
+            off_diagonal, storage = self.build_coefficients(compressibility, viscosity, density)
+            flux_derivative = off_diagonal * k_mean_derivative * (sample_pressure[1:] - sample_pressure[:-1])
+            gradient[0] += np.dot(adjoint[:-1] - adjoint[1:], flux_derivative)
+            gradient[1] += np.dot(adjoint, porosity_derivative * (- storage * sample_pressure - solution_vector))
+
+        return gradient
+
+    def get_storage_derivative(self, sample_pressure):
+        # d(storage * p)/dp of the previous time level as it enters the next step
+        self.data.update({'actual_time_step': self.data['actual_time_step'] + 1})
+        compressibility, viscosity, density, compressibility_derivative, _, density_derivative = \
+            self.get_property_derivatives(sample_pressure)
+        _, storage = self.build_coefficients(compressibility, viscosity, density)
+        self.data.update({'actual_time_step': self.data['actual_time_step'] - 1})
+        return storage * (1 + sample_pressure * (compressibility_derivative / compressibility
+                                                 + density_derivative / density))
 
     @staticmethod
     def residuum(A, x_guess, b):
         r = abs(np.sum((A*x_guess - b) / b))
         return r
 
+    @profiled('assembly')
     def get_linear_system(self, sample_pressure):
         main_diagonal, off_diagonal, solution_vector = self.build_diagonals(sample_pressure)
-        A = scipy.sparse.diags(
-            diagonals=[main_diagonal*-1, off_diagonal, off_diagonal],
-            offsets=[0, -1, 1],
-            shape=(self.number_of_cells, self.number_of_cells),
-            format='csr')
+        A = self.assemble(off_diagonal, main_diagonal, off_diagonal)
         b = - solution_vector * sample_pressure
         return A, b
 
+    def assemble(self, lower_diagonal, main_diagonal, upper_diagonal):
+        if self.config.linear_solver == 'sparse':
+            return scipy.sparse.diags(
+                diagonals=[main_diagonal, lower_diagonal, upper_diagonal],
+                offsets=[0, -1, 1],
+                shape=(self.config.number_of_cells, self.config.number_of_cells),
+                format='csr')
+        return lower_diagonal, main_diagonal, upper_diagonal
+
+    @profiled('linear_solve')
+    def solve(self, coefficient_matrix, solution_vector):
+        if self.config.linear_solver == 'sparse':
+            return scipy.sparse.linalg.spsolve(coefficient_matrix, solution_vector)
+        elif self.config.linear_solver == 'banded':
+            return tridiagonal.solve_banded(*coefficient_matrix, solution_vector)
+        return tridiagonal.solve_thomas(*coefficient_matrix, solution_vector)
+
+    def get_time_weights(self):
+        # weights of the storage and the flux term of the new time level and the ratio of the current
+        # to the last time step; both second order schemes start with backward Euler, BDF2 has no older
+        # level yet and the pressure jump at the chambers would make Crank-Nicolson oscillate
+        step = self.data['actual_time_step']
+        if self.config.time_integration == 'bdf2' and step >= 1:
+            ratio = self.data['timesteps'][step] / self.data['timesteps'][step-1]
+            return (1 + 2*ratio) / (1 + ratio), 1, ratio
+        elif self.config.time_integration == 'crank_nicolson' and step >= 2:
+            return 1, 0.5, 0
+        return 1, 1, 0
+
+    @profiled('assembly')
+    def get_right_hand_side(self, sample_pressure):
+        # contribution of the old time levels to the system of the new one
+        compressibility, viscosity, density = self.get_coolprop_data(sample_pressure)
+        off_diagonal, storage = self.build_coefficients(compressibility, viscosity, density)
+        storage_weight, flux_weight, ratio = self.get_time_weights()
+        solution_vector = - storage * sample_pressure
+        if flux_weight < 1:
+            flux = (1 - flux_weight) * off_diagonal * (sample_pressure[..., 1:] - sample_pressure[..., :-1])
+            solution_vector[..., :-1] -= flux
+            solution_vector[..., 1:] += flux
+        if ratio:
+            _, older_storage = self.build_coefficients(*self.get_coolprop_data(self.older_pressure))
+            solution_vector = (1 + ratio) * solution_vector \
+                + ratio**2 / (1 + ratio) * older_storage * self.older_pressure
+        return solution_vector
+
     def build_diagonals(self, sample_pressure):
-        k, n = self.initialize_permeability_porosity()
+        # the main diagonal is returned with the sign of the coefficient matrix
         compressibility, viscosity, density = self.get_coolprop_data(sample_pressure)
-        dx = self.sample['length'] / (self.number_of_cells - 1)
-        dt = self.data['timesteps'][self.data['actual_time_step']]
+        off_diagonal, solution_vector = self.build_coefficients(compressibility, viscosity, density)
+        storage_weight, flux_weight, _ = self.get_time_weights()
+        if flux_weight != 1:
+            off_diagonal *= flux_weight
+        main_diagonal = solution_vector * -storage_weight
+        main_diagonal[..., :-1] -= off_diagonal
+        main_diagonal[..., 1:] -= off_diagonal
+        return main_diagonal, off_diagonal, solution_vector
+
+    def get_cell_widths(self):
+        # 'uniform' and 'graded' divide the length among the sample cells, 'graded' with a tanh stretching
+        # toward both chamber faces, where the pressure fronts start and the chamber pressures are taken; the
+        # stretching does not depend on the number of cells, so refined meshes stay comparable; the chambers
+        # get the width of their neighbour; 'original' keeps the spacing length / (number_of_cells - 1) of
+        # the original model, whose sample cells span only (number_of_cells - 2) / (number_of_cells - 1) of
+        # the length, to reproduce earlier results
+        number_of_cells = self.config.number_of_cells
+        length = self.sample['length']
+        if self.config.mesh == 'original':
+            return np.full(number_of_cells, length / (number_of_cells - 1))
+        elif self.config.mesh == 'uniform':
+            return np.full(number_of_cells, length / (number_of_cells - 2))
+
+        stretching = self.config.mesh_stretching
+        coordinate = np.linspace(0, 1, number_of_cells - 1)
+        faces = (1 + np.tanh(stretching * (2*coordinate - 1)) / np.tanh(stretching)) / 2
+        widths = np.diff(faces) * length
+        return np.concatenate([widths[:1], widths, widths[-1:]])
+
+    def prepare_workspace(self):
+        # the parts of the coefficients that do not change during a simulation
+        k, n = self.initialize_permeability_porosity()
+        dx = self.cell_widths
         area = self.sample['area']
-        inlet_volume = self.sample['inlet_chamber_volume']
-        outlet_volume = self.sample['outlet_chamber_volume']
-
-        viscosity_mean = (viscosity[1:] + viscosity[:-1]) / 2
-        density_mean = (density[1:] + density[:-1]) / 2
-        k_mean_harmonic = ((2*k[1:]*k[:-1]) / (k[1:]+k[:-1]))
-
-        off_diagonal = (density_mean * area * k_mean_harmonic) / (viscosity_mean * dx)
-        main_diagonal = (area * n * compressibility * density * dx) / dt
-        main_diagonal[1:-1] = main_diagonal[1:-1] + off_diagonal[:-1] + off_diagonal[1:]
-        main_diagonal[0] = (inlet_volume * density[0] * compressibility[0]) / dt + off_diagonal[0]
-        main_diagonal[-1] = (outlet_volume * density[-1] * compressibility[-1]) / dt + off_diagonal[-1]
-        solution_vector = area * n * compressibility * density * dx / dt
-        solution_vector[0] = inlet_volume * density[0] * compressibility[0] / dt
-        solution_vector[-1] = outlet_volume * density[-1] * compressibility[-1] / dt
+        # harmonic mean over the two half cells between the cell centres, weighted by their widths
+        distance = (dx[1:] + dx[:-1]) / 2
+        k_mean_harmonic = (2*distance*k[..., 1:]*k[..., :-1]) / (dx[:-1]*k[..., 1:] + dx[1:]*k[..., :-1])
+        storage_volume = area * n * dx
+        storage_volume[..., 0] = self.sample['inlet_chamber_volume']
+        storage_volume[..., -1] = self.sample['outlet_chamber_volume']
 
-        return main_diagonal, off_diagonal, solution_vector
+        # a temperature in the sample data holds for all windows of a measurement, otherwise the mean of the data
+        temperature = self.sample.get('temperature', self.data['temperature'].mean())
+        property_table = None
+        if self.config.property_backend == 'table':
+            property_table = PropertyTable.get(self.sample['gas'], temperature)
+        multipliers = np.array([self.config.compressibility_multiplier, self.config.viscosity_multiplier,
+                                self.config.density_multiplier])
+
+        shape = self.batch_shape + (self.config.number_of_cells,)
+        return {'permeability': k,
+                'porosity': n,
+                'transmissibility': area * k_mean_harmonic / distance,
+                'storage_volume': storage_volume,
+                'temperature': temperature,
+                'property_table': property_table,
+                'multipliers': multipliers.reshape((3,) + (1,) * len(shape)),
+                'scaled': np.any(multipliers != 1)}
+
+    def build_coefficients(self, compressibility, viscosity, density):
+        # new arrays on every call, the workspace only supplies the constant parts
+        workspace = self.workspace
+        dt = self.data['timesteps'][self.data['actual_time_step']]
+
+        # the ratio of the mean density and viscosity of neighbouring cells times the constant transmissibility
+        off_diagonal = density[..., 1:] + density[..., :-1]
+        off_diagonal /= viscosity[..., 1:] + viscosity[..., :-1]
+        off_diagonal *= workspace['transmissibility']
+
+        storage = compressibility * density
+        storage *= workspace['storage_volume']
+        storage /= dt
+
+        return off_diagonal, storage
 
     def initialize_permeability_porosity(self):
-        k = np.ones(self.number_of_cells) * self.guess['permeability']
-        k[0] = k[-1] = 1
-        n = np.ones(self.number_of_cells) * self.guess['porosity']
-        n[0] = n[-1] = 1
+        shape = self.batch_shape + (self.config.number_of_cells,)
+        k = np.ones(shape) * np.expand_dims(self.guess['permeability'], -1)
+        k[..., 0] = k[..., -1] = 1
+        n = np.ones(shape) * np.expand_dims(self.guess['porosity'], -1)
+        n[..., 0] = n[..., -1] = 1
         return k, n
 
+    @profiled('properties')
     def get_coolprop_data(self, pressure):
-        try:
+        workspace = self.workspace
+        if workspace['property_table'] is not None:
+            result = workspace['property_table'].lookup(pressure)
+        else:
             parameter = ['ISOTHERMAL_COMPRESSIBILITY', 'VISCOSITY', 'DMASS']
-            result = cp.PropsSI(parameter, 'T', self.data['temperature'].mean(), 'P', pressure, self.sample['gas'])
-            result = result.T
-
-            #result[0] = result[0] * settings.compressibility_multiplier
-            #result[1] = result[1] * settings.viscosity_multiplier
-            #result[2] = result[2] * settings.density_multiplier
-        except:
-            result = [np.zeros(self.number_of_cells),np.zeros(self.number_of_cells),np.zeros(self.number_of_cells)]
+            result = props_si(parameter, workspace['temperature'], np.ravel(pressure), self.sample['gas'])
+            result = result.T.reshape((len(parameter),) + np.shape(pressure))
+
+        if workspace['scaled']:
+            result *= workspace['multipliers']
         return result
 
     @staticmethod
@@ -135,5 +502,14 @@ class LinearSystem:
         #l2_diff = np.sqrt(np.sum((p - p_ref) ** 2))
         #l2_ref = np.sqrt(np.sum(p_ref ** 2))
         #return l2_diff / l2_ref
-        return np.linalg.norm(p-p_ref, 2) / np.linalg.norm(p_ref, 2)
+        return np.linalg.norm(p-p_ref, 2, axis=-1) / np.linalg.norm(p_ref, 2, axis=-1)
+
+
+
+class BatchLinearSystem(LinearSystem):
 
+    def __init__(self, df_100, sample_data, guesses, config=SolverConfig()):
+        guesses = np.asarray(guesses, dtype=float)
+        # only the Thomas sweep solves a stack of systems at once
+        config = dataclasses.replace(config, linear_solver='thomas')
+        super().__init__(df_100, sample_data, np.moveaxis(guesses, -1, 0), config)
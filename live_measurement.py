@@ -0,0 +1,170 @@
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+
+from import_data import Data, DataReaktor
+from optimize import Optimizer
+from pulse_decay import estimate_parameters
+from settings import SolverConfig
+
+
+class RawFileTail:
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+
+    def read_new_lines(self):
+        # parse only the complete lines written since the last call, a partially written last line
+        # is left in the file until the logger has finished it
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return None
+        if size < self.offset:
+            # the file has been replaced, start again from the beginning
+            self.offset = 0
+        if size == self.offset:
+            return None
+        df, self.offset = Data.parse_raw_file(self.path, self.offset)
+        return df
+
+
+class LiveMeasurement:
+    minimum_points = 20
+
+    def __init__(self, path, reaktor=False, guess=None, parameter='k', config=SolverConfig(), cache=None):
+        self.path = path
+        self.parameter = parameter
+        self.config = config
+        self.cache = cache
+        data_class = DataReaktor if reaktor else Data
+        self.data = data_class(path, config, interactive=False)
+        self.file_name = self.data.file_name
+        self.path_sim = os.path.join(os.path.dirname(os.path.dirname(path)), 'sim_data')
+        self.tail = RawFileTail(path)
+        self.sample_data = self.data.sample_data()
+        self.df = None
+        self.first_datetime = None
+        self.df_100 = None
+        self.df_final = None
+        self.guess = guess
+        self.initial_simplex = None
+        self.unfitted_rows = 0
+        self.history = pd.DataFrame({'Duration': [], 'k': [], 'n': [], 'error': [], 'confidence': []})
+
+    def update(self):
+        df = self.tail.read_new_lines()
+        if df is None or df.empty:
+            return 0
+        # the logger may repeat lines, keep only rows that are newer than the data we have
+        last_datetime = None
+        if self.df is not None:
+            last_datetime = self.df['DateTime'].values.astype('datetime64[ns]').astype(np.int64)[-1]
+        df = Data.drop_duplicates(df, last_datetime)
+        if df.empty:
+            return 0
+        df = self.data.convert_units(df)
+        if self.first_datetime is None:
+            self.first_datetime = df['DateTime'].iloc[0]
+        df['Duration'] = (df['DateTime'] - self.first_datetime).dt.total_seconds()
+        self.df = pd.concat([self.df, df], ignore_index=True)
+        self.unfitted_rows += len(df)
+        return len(df)
+
+    def resample(self):
+        df = self.df.copy()
+        self.data.set_start_stop(df)
+        self.df_final = self.data.reset_duration(df.iloc[self.data.start:self.data.stop])
+        if len(self.df_final) < self.minimum_points:
+            return False
+        self.df_100 = self.data.interpolate(self.df_final)
+        return True
+
+    def refit(self):
+        if self.df is None or not self.resample():
+            return None
+        self.unfitted_rows = 0
+        if self.guess is None:
+            try:
+                self.guess = estimate_parameters(self.df_100, self.sample_data)
+            except ValueError as ex:
+                print(f'{self.file_name}: no estimate yet, {ex.args[0]}')
+                return None
+            print(f'Analytic estimate: k = {self.guess[0]:.4} m^2, n = {self.guess[1]:.4}')
+
+        # continue from the estimate and the simplex of the last fit
+        optimizer = Optimizer(self.df_100, self.sample_data, self.guess, self.config, self.cache)
+        result, _ = optimizer.nelder_mead(self.parameter, self.initial_simplex)
+        if self.parameter == 'k':
+            self.guess = [result.x[0], self.guess[1]]
+        elif self.parameter == 'both':
+            self.guess = list(result.x)
+        self.initial_simplex = Optimizer.warm_start_simplex(result.final_simplex[0])
+
+        self.history.loc[len(self.history)] = [self.df_final['Duration'].max(), self.guess[0], self.guess[1],
+                                               result.fun / 100, self.data.confidence]
+        self.save_history()
+        return result
+
+    def is_converged(self, tolerance=0.01, window=3):
+        # k has changed by less than the tolerance over the last fits
+        if len(self.history) < window:
+            return False
+        k = self.history['k'].values[-window:]
+        return (k.max() - k.min()) / k[-1] <= tolerance
+
+    def save_history(self):
+        os.makedirs(self.path_sim, exist_ok=True)
+        path = os.path.join(self.path_sim, self.file_name + '_live.csv')
+        self.history.to_csv(path, index=False, float_format='%.6g')
+
+    def follow(self, poll_interval=60, refit_interval=3600, tolerance=None, maximum_duration=None):
+        last_fit = None
+        start_time = time.time()
+        try:
+            while True:
+                new_rows = self.update()
+                if new_rows and (last_fit is None or time.time() - last_fit >= refit_interval):
+                    last_fit = time.time()
+                    if self.refit() is not None:
+                        self.print_last_fit()
+                        if tolerance is not None and self.is_converged(tolerance):
+                            print(f'{self.file_name}: k has converged to {tolerance:.1%}, '
+                                  f'the test can be stopped.')
+                            return self.history
+                if maximum_duration is not None and time.time() - start_time > maximum_duration:
+                    break
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            pass
+        return self.close()
+
+    def close(self):
+        # the rows written since the last periodic fit are fitted once more when following ends
+        self.update()
+        if self.unfitted_rows and self.refit() is not None:
+            self.print_last_fit()
+        return self.history
+
+    def print_last_fit(self):
+        row = self.history.iloc[-1]
+        print(f'{self.file_name}: t = {row["Duration"]:.0f} s, k = {row["k"]:.4} m^2, '
+              f'n = {row["n"]:.4}, e = {row["error"]:.3}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Follow a running measurement and refit it periodically.')
+    parser.add_argument('path')
+    parser.add_argument('--reaktor', action='store_true')
+    parser.add_argument('--parameter', choices=['k', 'both'], default='k')
+    parser.add_argument('--guess', type=float, nargs=2, default=None)
+    parser.add_argument('--poll', type=float, default=60, help='seconds between reads of the raw file')
+    parser.add_argument('--refit', type=float, default=3600, help='seconds between fits')
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help='stop once k changes by less than this fraction over the last three fits')
+    args = parser.parse_args()
+    live = LiveMeasurement(args.path, args.reaktor, args.guess, args.parameter)
+    live.follow(args.poll, args.refit, args.tolerance)
@@ -3,9 +3,6 @@ import glob
 import pandas as pd
 from measurement import Measurement, MeasurementReaktor
 
-import settings
-settings.init()
-
 pd.set_option('display.width', 400)
 pd.set_option('display.max_columns', 10)
 
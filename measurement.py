@@ -2,18 +2,35 @@ import pandas as pd
 
 from import_data import Data, DataReaktor
 import os
+import copy
+import dataclasses
+from concurrent.futures import ProcessPoolExecutor
 from optimize import Optimizer
 from linear_system import LinearSystem
 import numpy as np
 from plots import Plotter, PlotterReaktor
+from pulse_decay import estimate_parameters
+from settings import SolverConfig
+from simulation_cache import PrefixStore, SimulationCache
 
-import settings
+
+def fit_scenario(scenario, parameter):
+    optimizer = Optimizer(scenario['df_100'], scenario['sample_data'], scenario['guess'], scenario['config'],
+                          scenario['cache'])
+    result, opt_steps = optimizer.nelder_mead(parameter)
+    return result, opt_steps, optimizer.df_100
 
 
 class Measurement:
+    # the nested grids of the space-time grid convergence study, finest first
+    grid_dimensions = [100, 50, 25]
+    grid_time_steps = [200, 100, 50]
 
-    def __init__(self, path):
+    def __init__(self, path, config=SolverConfig(), interactive=True, cache=None):
         self.path = path
+        self.config = config
+        self.interactive = interactive
+        self.cache = cache
         self.file_name, _ = os.path.splitext(os.path.split(path)[1])
         self.path_raw, _ = os.path.splitext(os.path.split(path)[0])
         self.path_sim = os.path.join(os.path.dirname(os.path.dirname(path)), 'sim_data')
@@ -21,19 +38,42 @@ class Measurement:
         self.df_final = None
         self.sample_data = None
 
-    def richardson_extrapolation(self, solution):
-        grid_dimensions = [100, 50, 25]
-        time_steps = [200, 100, 50]
-        mesh_refinement_ratio = (grid_dimensions[0] / grid_dimensions[1]) * (time_steps[0] / time_steps[1])
+    def richardson_extrapolation(self, solution, refinement='space_time'):
+        # 'space_time' refines cells and time steps together and compares the final pressures, 'time' only
+        # refines the time steps on the cells of the configuration and compares the pressures at three
+        # quarters of the logarithmic time axis, a common point of the three nested grids while both
+        # chambers still change
+        if refinement == 'space_time':
+            grid_dimensions = self.grid_dimensions
+            time_steps = self.grid_time_steps
+            file_name = 'a.csv'
+        elif refinement == 'time':
+            grid_dimensions = [self.config.number_of_cells] * 3
+            time_steps = [401, 201, 101]
+            file_name = 'a_time.csv'
+        else:
+            raise ValueError(f'Unknown refinement: {refinement}')
         pressures = []
-        safety_factor = 1.25
 
         for i in range(len(grid_dimensions)):
-            LinearSystem.number_of_cells = grid_dimensions[i]
-            Data.number_of_time_steps = time_steps[i]
-            self.set_adjusted_data()
-            data = LinearSystem(self.df_100, self.sample_data, solution).solve_linear_system()
-            pressures.append(data['cell_pressure'])
+            config = dataclasses.replace(self.config, number_of_cells=grid_dimensions[i],
+                                         number_of_time_steps=time_steps[i])
+            self.set_adjusted_data(config)
+            data = LinearSystem(self.df_100, self.sample_data, solution, config).solve_linear_system()
+            if refinement == 'space_time':
+                pressures.append(data['cell_pressure'])
+            else:
+                pressures.append(data['cell_pressure_history'][3 * (len(data['duration']) - 1) // 4])
+        return self.grid_convergence(pressures, grid_dimensions, time_steps, file_name, refinement)
+
+    def grid_convergence(self, pressures, grid_dimensions, time_steps, file_name, refinement='space_time'):
+        # pressures of the finest, medium and coarsest grid; the time steps are numbers of time levels, the
+        # refinement ratio of the time step is that of the numbers of intervals between them
+        expected_order = {'backward_euler': 1, 'bdf2': 2, 'crank_nicolson': 2}[self.config.time_integration]
+        mesh_refinement_ratio = (grid_dimensions[0] / grid_dimensions[1]) \
+            * ((time_steps[0] - 1) / (time_steps[1] - 1))
+        safety_factor = 1.25
+        order_tolerance = 0.25
 
         points = np.array([[pressures[0][0], pressures[0][-1]],
                            [pressures[1][0], pressures[1][-1]],
@@ -52,7 +92,7 @@ class Measurement:
         df = pd.DataFrame(
             [points[0], points[1], points[2], p_exact, order_of_convergence, GCI_1, GCI_2, asymptotic_range]).T
         df.columns = ['p_fine', 'p_medium', 'p_coarse', 'p_exact', 'order_of_convergence', 'GCI_1', 'GCI_2', 'range']
-        df.to_csv(self.path_sim + '//a.csv', index=False, float_format='%.6g')
+        df.to_csv(self.path_sim + '//' + file_name, index=False, float_format='%.6g')
 
         print(f'''
         --- Grid Convergence Study ---
@@ -65,6 +105,7 @@ class Measurement:
             4           4           {points[2][0]:.0f} | {points[2][-1]:.0f}
 
         Order of convergence p = {order_of_convergence[0]:.5f} | {order_of_convergence[-1]:.5f}
+        Order of the time integration ({self.config.time_integration}) = {expected_order}
 
 
         Richardson Extrapolation: Calculated with the first and second finest grids.
@@ -84,126 +125,142 @@ class Measurement:
         range = {asymptotic_range[0]:.4f} | {asymptotic_range[-1]:.4f}
 
         ''')
-
-    def calculate_uncertainty(self, parameter='k'):
-        df_opt = pd.DataFrame()
-
-        for i in range(17):
-            self.set_adjusted_data()
-            settings.init()
-            try:
-                t_max = self.df_100['Duration'].max()
-                inlet_error = self.sample_data['inlet_sensor']['range'] * (
-                            self.sample_data['inlet_sensor']['error'] + base_error)
-                P_ein_max = self.df_100['Inlet_Pressure'] + inlet_error
-                P_ein_min = self.df_100['Inlet_Pressure'] - inlet_error
-                outlet_error = self.sample_data['outlet_sensor']['range'] * (
-                            self.sample_data['outlet_sensor']['error'] + base_error)
-                P_aus_max = self.df_100['Outlet_Pressure'] + outlet_error
-                P_aus_min = self.df_100['Outlet_Pressure'] - outlet_error
-            except:
-                pass
-
-            if i == 1:
-                self.df_100['Inlet_Pressure'] = P_ein_max - (
-                            (P_ein_max - self.df_100['Inlet_Pressure']) * self.df_100['Duration'] / t_max)
-                self.df_100['Outlet_Pressure'] = P_aus_min - (
-                            (P_aus_min - self.df_100['Outlet_Pressure']) * self.df_100['Duration'] / t_max)
-
-            elif i == 2:
-                self.df_100['Inlet_Pressure'] = P_ein_min - (
-                            (P_ein_min - self.df_100['Inlet_Pressure']) * self.df_100['Duration'] / t_max)
-                self.df_100['Outlet_Pressure'] = P_aus_max - (
-                            (P_aus_max - self.df_100['Outlet_Pressure']) * self.df_100['Duration'] / t_max)
-                original_k = guess[0] * 0.1
-                recent_k = result.x[0]
-
-            elif i == 3:
-                settings.compressibility_multiplier = 0.997
-                settings.viscosity_multiplier = 0.96
-                settings.density_multiplier = 0.9996
-                if original_k > recent_k:
-                    self.df_100['Inlet_Pressure'] = P_ein_max - (
-                                (P_ein_max - self.df_100['Inlet_Pressure']) * self.df_100['Duration'] / t_max)
-                    self.df_100['Outlet_Pressure'] = P_aus_min - (
-                                (P_aus_min - self.df_100['Outlet_Pressure']) * self.df_100['Duration'] / t_max)
-                else:
-                    self.df_100['Inlet_Pressure'] = P_ein_min - (
-                                (P_ein_min - self.df_100['Inlet_Pressure']) * self.df_100['Duration'] / t_max)
-                    self.df_100['Outlet_Pressure'] = P_aus_max - (
-                                (P_aus_max - self.df_100['Outlet_Pressure']) * self.df_100['Duration'] / t_max)
-                self.df_100['Temperature'] = self.df_100['Temperature'] - 0.5
-                self.sample_data['length'] = self.sample_data['length'] * 0.995
-                self.sample_data['diameter'] = self.sample_data['diameter'] * 1.005
-                self.sample_data['inlet_chamber_volume'] = self.sample_data['inlet_chamber_volume'] * 0.98
-                self.sample_data['outlet_chamber_volume'] = self.sample_data['outlet_chamber_volume'] * 0.98
-            elif i == 4:
-                settings.compressibility_multiplier = 1.003
-                settings.viscosity_multiplier = 1.04
-                settings.density_multiplier = 1.0004
-                if original_k > recent_k:
-                    self.df_100['Inlet_Pressure'] = P_ein_min - (
-                                (P_ein_min - self.df_100['Inlet_Pressure']) * self.df_100['Duration'] / t_max)
-                    self.df_100['Outlet_Pressure'] = P_aus_max - (
-                                (P_aus_max - self.df_100['Outlet_Pressure']) * self.df_100['Duration'] / t_max)
-                else:
-                    self.df_100['Inlet_Pressure'] = P_ein_max - (
-                                (P_ein_max - self.df_100['Inlet_Pressure']) * self.df_100['Duration'] / t_max)
-                    self.df_100['Outlet_Pressure'] = P_aus_min - (
-                                (P_aus_min - self.df_100['Outlet_Pressure']) * self.df_100['Duration'] / t_max)
-                self.df_100['Temperature'] = self.df_100['Temperature'] + 0.5
-                self.sample_data['length'] = self.sample_data['length'] * 1.005
-                self.sample_data['diameter'] = self.sample_data['diameter'] * 0.995
-                self.sample_data['inlet_chamber_volume'] = self.sample_data['inlet_chamber_volume'] * 1.02
-                self.sample_data['outlet_chamber_volume'] = self.sample_data['outlet_chamber_volume'] * 1.02
-
-            elif i == 5:
-                self.df_100['Temperature'] = self.df_100['Temperature'] - 0.5
-            elif i == 6:
-                self.df_100['Temperature'] = self.df_100['Temperature'] + 0.5
-            elif i == 7:
-                self.sample_data['length'] = self.sample_data['length'] * 0.995
-                self.sample_data['diameter'] = self.sample_data['diameter'] * 1.005
-            elif i == 8:
-                self.sample_data['length'] = self.sample_data['length'] * 1.005
-                self.sample_data['diameter'] = self.sample_data['diameter'] * 0.995
-            elif i == 9:
-                self.sample_data['inlet_chamber_volume'] = self.sample_data['inlet_chamber_volume'] * 0.98
-                self.sample_data['outlet_chamber_volume'] = self.sample_data['outlet_chamber_volume'] * 0.98
-            elif i == 10:
-                self.sample_data['inlet_chamber_volume'] = self.sample_data['inlet_chamber_volume'] * 1.02
-                self.sample_data['outlet_chamber_volume'] = self.sample_data['outlet_chamber_volume'] * 1.02
-            elif i == 11:
-                settings.compressibility_multiplier = 0.997
-            elif i == 12:
-                settings.compressibility_multiplier = 1.003
-            elif i == 13:
-                settings.viscosity_multiplier = 0.96
-            elif i == 14:
-                settings.viscosity_multiplier = 1.04
-            elif i == 15:
-                settings.density_multiplier = 0.9996
-            elif i == 16:
-                settings.density_multiplier = 1.0004
-
-            guess = pd.read_csv(os.path.join(self.path_sim, self.file_name + '.csv'),
-                                skiprows=6, nrows=2, header=None, sep=':', usecols=[1])
-            guess = [float(guess.loc[0]) * 10, float(guess.loc[1])]
-            result = Optimizer(self.df_100, self.sample_data, guess)
-            result, opt_steps = result.nelder_mead(parameter)
-            df_opt = pd.concat([df_opt, pd.DataFrame(opt_steps[1:], columns=opt_steps[0])], axis=1)
-            base_error = result.fun / 100
-            i += 1
-
+        # only a pure time refinement converges with the order of the time integration
+        if refinement == 'time' and np.any(abs(order_of_convergence - expected_order) > order_tolerance):
+            print(f'Warning: the observed order of convergence {order_of_convergence[0]:.3f} | '
+                  f'{order_of_convergence[-1]:.3f} differs from the order {expected_order} of '
+                  f'{self.config.time_integration} by more than {order_tolerance}, the grids are not in the '
+                  f'asymptotic range or the time integration does not reach its order.')
+        return df
+
+    def calculate_uncertainty(self, parameter='k', workers=None):
+        self.set_adjusted_data()
+        solution = pd.read_csv(os.path.join(self.path_sim, self.file_name + '.csv'),
+                               nrows=10, sep=':', index_col=0, header=None)
+        solution = [float(solution.loc['k', 1]), float(solution.loc['n', 1]), float(solution.loc['error', 1])]
+        original_k, porosity, base_error = solution
+
+        # scenarios 3 and 4 combine all deviations in the direction in which scenario 1 moved k,
+        # so they are fitted once the first stage has finished
+        first_stage = [i for i in range(17) if i not in (3, 4)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            scenarios = [self.uncertainty_scenario(i, porosity, base_error) for i in first_stage]
+            results = dict(zip(first_stage, executor.map(fit_scenario, scenarios, [parameter] * len(scenarios))))
+            k_decreased = original_k > results[1][0].x[0]
+            scenarios = [self.uncertainty_scenario(i, porosity, base_error, k_decreased) for i in (3, 4)]
+            results.update(zip((3, 4), executor.map(fit_scenario, scenarios, [parameter] * len(scenarios))))
+
+        df_opt = pd.concat([pd.DataFrame(results[i][1][1:], columns=results[i][1][0]) for i in range(17)], axis=1)
         path = os.path.join(self.path_sim + '//uncertainty', self.file_name + '_uncertainty.txt')
         df_opt.to_csv(path, index=False, float_format='%.6g')
         return df_opt
 
+    def calculate_error_scan(self, k_values, n_values=None, batch_size=64):
+        # the error on the grid of k and n, the candidates of a batch are simulated together; without n_values
+        # at the porosity of the analytic estimate
+        if self.find_file():
+            self.set_adjusted_data()
+        else:
+            self.set_data()
+        if n_values is None:
+            n_values = [estimate_parameters(self.df_100, self.sample_data)[1]]
+        guesses = np.array([[k, n] for n in n_values for k in k_values])
+
+        optimizer = Optimizer(self.df_100, self.sample_data, guesses[0], self.config)
+        errors = np.concatenate([optimizer.evaluate_batch(guesses[i:i + batch_size])
+                                 for i in range(0, len(guesses), batch_size)])
+        df_scan = pd.DataFrame({'k': guesses[:, 0], 'n': guesses[:, 1], 'e': errors / 100})
+        os.makedirs(self.path_sim, exist_ok=True)
+        df_scan.to_csv(os.path.join(self.path_sim, self.file_name + '_scan.csv'), index=False, float_format='%.6g')
+        best = df_scan['e'].idxmin()
+        print(f'Smallest error of the scan: k = {df_scan.loc[best, "k"]:.4} m^2, n = {df_scan.loc[best, "n"]:.4}, '
+              f'e = {df_scan.loc[best, "e"] * 100:.3} %')
+        return df_scan
+
+    def uncertainty_scenario(self, i, porosity, base_error, k_decreased=None):
+        df_100 = self.df_100.copy()
+        sample_data = copy.deepcopy(self.sample_data)
+        multipliers = {'compressibility_multiplier': 1, 'viscosity_multiplier': 1, 'density_multiplier': 1}
+
+        t_max = df_100['Duration'].max()
+        inlet_error = sample_data['inlet_sensor']['range'] * (sample_data['inlet_sensor']['error'] + base_error)
+        outlet_error = sample_data['outlet_sensor']['range'] * (sample_data['outlet_sensor']['error'] + base_error)
+        pressure_bounds = {'Inlet_Pressure': {'max': df_100['Inlet_Pressure'] + inlet_error,
+                                              'min': df_100['Inlet_Pressure'] - inlet_error},
+                           'Outlet_Pressure': {'max': df_100['Outlet_Pressure'] + outlet_error,
+                                               'min': df_100['Outlet_Pressure'] - outlet_error}}
+
+        def shift_pressure(inlet_bound, outlet_bound):
+            for column, bound in (('Inlet_Pressure', inlet_bound), ('Outlet_Pressure', outlet_bound)):
+                p_bound = pressure_bounds[column][bound]
+                df_100[column] = p_bound - ((p_bound - df_100[column]) * df_100['Duration'] / t_max)
+
+        if i == 1:
+            shift_pressure('max', 'min')
+        elif i == 2:
+            shift_pressure('min', 'max')
+        elif i == 3:
+            multipliers = {'compressibility_multiplier': 0.997, 'viscosity_multiplier': 0.96,
+                           'density_multiplier': 0.9996}
+            if k_decreased:
+                shift_pressure('max', 'min')
+            else:
+                shift_pressure('min', 'max')
+            df_100['Temperature'] = df_100['Temperature'] - 0.5
+            sample_data['length'] = sample_data['length'] * 0.995
+            sample_data['diameter'] = sample_data['diameter'] * 1.005
+            sample_data['inlet_chamber_volume'] = sample_data['inlet_chamber_volume'] * 0.98
+            sample_data['outlet_chamber_volume'] = sample_data['outlet_chamber_volume'] * 0.98
+        elif i == 4:
+            multipliers = {'compressibility_multiplier': 1.003, 'viscosity_multiplier': 1.04,
+                           'density_multiplier': 1.0004}
+            if k_decreased:
+                shift_pressure('min', 'max')
+            else:
+                shift_pressure('max', 'min')
+            df_100['Temperature'] = df_100['Temperature'] + 0.5
+            sample_data['length'] = sample_data['length'] * 1.005
+            sample_data['diameter'] = sample_data['diameter'] * 0.995
+            sample_data['inlet_chamber_volume'] = sample_data['inlet_chamber_volume'] * 1.02
+            sample_data['outlet_chamber_volume'] = sample_data['outlet_chamber_volume'] * 1.02
+        elif i == 5:
+            df_100['Temperature'] = df_100['Temperature'] - 0.5
+        elif i == 6:
+            df_100['Temperature'] = df_100['Temperature'] + 0.5
+        elif i == 7:
+            sample_data['length'] = sample_data['length'] * 0.995
+            sample_data['diameter'] = sample_data['diameter'] * 1.005
+        elif i == 8:
+            sample_data['length'] = sample_data['length'] * 1.005
+            sample_data['diameter'] = sample_data['diameter'] * 0.995
+        elif i == 9:
+            sample_data['inlet_chamber_volume'] = sample_data['inlet_chamber_volume'] * 0.98
+            sample_data['outlet_chamber_volume'] = sample_data['outlet_chamber_volume'] * 0.98
+        elif i == 10:
+            sample_data['inlet_chamber_volume'] = sample_data['inlet_chamber_volume'] * 1.02
+            sample_data['outlet_chamber_volume'] = sample_data['outlet_chamber_volume'] * 1.02
+        elif i == 11:
+            multipliers['compressibility_multiplier'] = 0.997
+        elif i == 12:
+            multipliers['compressibility_multiplier'] = 1.003
+        elif i == 13:
+            multipliers['viscosity_multiplier'] = 0.96
+        elif i == 14:
+            multipliers['viscosity_multiplier'] = 1.04
+        elif i == 15:
+            multipliers['density_multiplier'] = 0.9996
+        elif i == 16:
+            multipliers['density_multiplier'] = 1.0004
+
+        guess = estimate_parameters(df_100, sample_data, porosity)
+        return {'df_100': df_100, 'sample_data': sample_data, 'guess': guess,
+                'config': dataclasses.replace(self.config, **multipliers), 'cache': self.cache}
+
     def calculate_permeability_flask(self, df_100, sample_data, guess, parameter='k'):
-        result = Optimizer(df_100, sample_data, guess)
+        result = Optimizer(df_100, sample_data, guess, self.config, self.cache)
         result, opt_steps = result.nelder_mead(parameter)
 
-    def calculate_permeability(self, guess, parameter='k'):
+    def calculate_permeability(self, guess=None, parameter='k'):
         if self.find_file():
             user_input = input('Bereits angepasste Messdaten nutzen? (y/n')
             if user_input == 'y':
@@ -212,8 +269,9 @@ class Measurement:
                 self.set_data()
         else:
             self.set_data()
+        guess = self.get_initial_guess(guess)
 
-        result = Optimizer(self.df_100, self.sample_data, guess)
+        result = Optimizer(self.df_100, self.sample_data, guess, self.config, self.cache)
         result, opt_steps = result.nelder_mead(parameter)
 
         plot = Plotter(self.df_100, **{'name': self.file_name})
@@ -225,29 +283,122 @@ class Measurement:
             self.save_adjusted_measurement_file()
             self.save_results()
 
-    def calculate_permeability_stepwise(self, guess, parameter='k'):
-        self.set_data()
-        data = Data(self.path)
-        df_100_list = []
-        result_list = []
-        temp = pd.DataFrame({'t': [], 'k': []})
-
-        result = Optimizer(self.df_100, self.sample_data, guess)
-        result, opt_steps = result.nelder_mead(parameter)
-        df_100_list.append(self.df_100)
-        result_list.append(result)
-        temp.loc[0] = [df_100_list[0]['Duration'].max(), result_list[0].x[0]]
+    def calculate_permeability_batch(self, guess=None, parameter='k', multi_start=False, workers=None,
+                                     error_budget=None):
+        # multi_start fits in log10(k) from several starts around the guess, for samples whose guess is far
+        # off or whose error has more than one minimum; error_budget stops the simulation of candidates whose
+        # error exceeds this factor on the best error so far
+        if self.find_file():
+            self.set_adjusted_data()
+        else:
+            self.set_data()
+        guess = self.get_initial_guess(guess)
 
-        duration_10_percent = self.df_final['Duration'].max() * 0.1
-        for i in range(9):
-            self.df_100 = self.df_final[self.df_final['Duration'].between(1, duration_10_percent * (i + 1))]
-            self.df_100.reset_index(inplace=True, drop=True)
-            self.df_100 = data.interpolate(self.df_100)
-            result = Optimizer(self.df_100, self.sample_data, guess)
+        result = Optimizer(self.df_100, self.sample_data, guess, self.config, self.cache,
+                           error_budget=error_budget)
+        if multi_start:
+            result, opt_steps = result.multi_start(parameter, workers=workers)
+        else:
             result, opt_steps = result.nelder_mead(parameter)
-            df_100_list.append(self.df_100)
-            result_list.append(result)
-            temp.loc[i + 1] = [df_100_list[-1]['Duration'].max(), result_list[-1].x[0]]
+
+        self.add_results(result, guess)
+        os.makedirs(self.path_sim, exist_ok=True)
+        self.save_results()
+        return self.sample_data
+
+    def calculate_permeability_multilevel(self, guess=None, parameter='k', error_budget=None):
+        # fits on the grids of the space-time convergence study from coarse to fine, every finer level starts
+        # from the result of the coarser one; the second level with a tenth of the default simplex, the finest
+        # one with the shift between the results of the two coarser levels, which is about the distance to
+        # its own result; the coarse levels stop at the change of the error at their start from the
+        # neighbouring level, about the discretization error of their objective, the finest one at the
+        # resolution of the error; the grid convergence index of the result is the check of the discretization
+        levels = [dataclasses.replace(self.config, number_of_cells=number_of_cells,
+                                      number_of_time_steps=number_of_time_steps)
+                  for number_of_cells, number_of_time_steps in zip(self.grid_dimensions, self.grid_time_steps)]
+        # the measurement interval is set once, every level interpolates the same data onto its time grid
+        if self.find_file():
+            self.set_adjusted_data(levels[0])
+        else:
+            self.set_data(levels[0])
+        levels = [(config, self.df_100 if i == 0 else self.interpolate(config)) for i, config in enumerate(levels)]
+        # the analytic estimate from the data of the finest level
+        guess = self.get_initial_guess(guess)
+        # the result is simulated again on the finest level
+        cache = self.cache if self.cache is not None else SimulationCache()
+
+        # the coarsest level has no coarser result, it is compared with the next finer level at its start
+        config, df_100 = levels[-2]
+        reference_error = Optimizer(df_100, self.sample_data, guess, config, cache).optimize_function(guess, 'both')
+        coarser_x0 = None
+        number_of_evaluations = 1
+        for i, (config, df_100) in enumerate(levels[::-1]):
+            optimizer = Optimizer(df_100, self.sample_data, guess, config, cache, error_budget=error_budget)
+            x0 = optimizer.to_log(guess, parameter)
+            # the error cannot be resolved better than the nonlinear tolerance of the simulation
+            tolerance = 100 * config.nonlinear_tolerance
+            if i < len(levels) - 1:
+                # the first vertex of the simplex, taken from the cache
+                tolerance = max(tolerance, abs(optimizer.optimize_function(guess, 'both') - reference_error))
+            if i == 0:
+                initial_simplex = None
+            elif i == 1:
+                initial_simplex = optimizer.log_simplex(x0, np.array(optimizer.log_steps) / 10)
+            else:
+                shift = np.maximum(abs(x0 - coarser_x0), np.array(optimizer.log_steps[:len(x0)]) / 100)
+                initial_simplex = optimizer.log_simplex(x0, shift)
+            coarser_x0 = x0
+            result, _ = optimizer.nelder_mead_log(x0, parameter, initial_simplex, xatol=np.inf, fatol=tolerance)
+            number_of_evaluations += result.nfev
+            reference_error = result.fun
+            guess = optimizer.from_log(result.x, parameter)
+            print(f'Level {i + 1}: {config.number_of_cells} cells, {config.number_of_time_steps} time steps, '
+                  f'tolerance {tolerance:.3} %, {result.nfev} evaluations, k = {guess[0]:.4} m^2, '
+                  f'n = {guess[1]:.4}, e = {result.fun:.3} %')
+
+        result.x = np.array(guess[:len(result.x)])
+        result.nfev = number_of_evaluations
+        optimizer.print_final_result(result)
+        optimizer.data = optimizer.simulate(guess)
+        optimizer.set_calculated_pressure()
+        self.df_100 = optimizer.df_100
+        self.add_results(result, guess)
+
+        # the grid convergence index of the result on the three levels, finest first
+        pressures = [optimizer.data['cell_pressure']]
+        for config, df_100 in levels[1:]:
+            data = LinearSystem(df_100, self.sample_data, guess, config).solve_linear_system()
+            pressures.append(data['cell_pressure'])
+        os.makedirs(self.path_sim, exist_ok=True)
+        self.grid_convergence(pressures, self.grid_dimensions, self.grid_time_steps, 'a.csv')
+        self.save_results()
+        return self.sample_data
+
+    def calculate_permeability_stepwise(self, guess=None, parameter='k', mode='independent', workers=None):
+        # mode 'independent' fits every window on its own resampled grid, 'parallel' does the same in a
+        # process pool, 'warm_start' fits the windows as prefixes of the full grid from short to long,
+        # each one starting from the simplex of the previous one and continuing its simulations; the gas
+        # properties of every window are those at the mean temperature of the whole measurement, so that the
+        # windows are simulated under the same conditions and a longer one continues a shorter one
+        self.set_data()
+        self.sample_data['temperature'] = float(self.df_100['Temperature'].mean())
+        guess = self.get_initial_guess(guess)
+        if mode == 'independent':
+            fits = [fit_scenario(scenario, parameter) for scenario in self.stepwise_scenarios(guess)]
+        elif mode == 'parallel':
+            scenarios = self.stepwise_scenarios(guess)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                fits = list(executor.map(fit_scenario, scenarios, [parameter] * len(scenarios)))
+        elif mode == 'warm_start':
+            fits = self.fit_windows_warm_start(guess, parameter)
+        else:
+            raise ValueError(f'Unknown stepwise mode {mode}')
+
+        result_list = [result for result, _, _ in fits]
+        df_100_list = [df_100 for _, _, df_100 in fits]
+        self.df_100 = df_100_list[0]
+        temp = pd.DataFrame({'t': [df_100['Duration'].max() for df_100 in df_100_list],
+                             'k': [result.x[0] for result in result_list]})
 
         plot = Plotter(df_100_list, **{'name': self.file_name, 'result': result_list})
         plot.result_chart_stepwise()
@@ -263,21 +414,63 @@ class Measurement:
         df.to_csv(path, index=False, mode='a', float_format='%.2f')
         temp.to_csv(path, mode='a', index=False)
 
+    def stepwise_scenarios(self, guess):
+        # the full measurement first, then the windows of 10 % to 90 % of its duration
+        data = Data(self.path, self.config, self.interactive)
+        duration_10_percent = self.df_final['Duration'].max() * 0.1
+        windows = [self.df_100]
+        for i in range(9):
+            df_100 = self.df_final[self.df_final['Duration'].between(1, duration_10_percent * (i + 1))]
+            df_100 = df_100.reset_index(drop=True)
+            windows.append(data.interpolate(df_100))
+        return [{'df_100': df_100, 'sample_data': self.sample_data, 'guess': guess, 'config': self.config,
+                 'cache': self.cache} for df_100 in windows]
+
+    def fit_windows_warm_start(self, guess, parameter):
+        duration_10_percent = self.df_100['Duration'].max() * 0.1
+        prefix_store = PrefixStore()
+        initial_simplex = None
+        fits = []
+        for i in range(10):
+            if i < 9:
+                df_100 = self.df_100[self.df_100['Duration'] <= duration_10_percent * (i + 1)].copy()
+            else:
+                df_100 = self.df_100.copy()
+            optimizer = Optimizer(df_100, self.sample_data, guess, self.config, self.cache, prefix_store)
+            result, opt_steps = optimizer.nelder_mead(parameter, initial_simplex)
+            fits.append((result, opt_steps, optimizer.df_100))
+            if parameter == 'k':
+                guess = [result.x[0], guess[1]]
+            elif parameter == 'both':
+                guess = list(result.x)
+            initial_simplex = Optimizer.warm_start_simplex(result.final_simplex[0])
+        # same order as the other modes, the full measurement first
+        return fits[-1:] + fits[:-1]
+
+    def get_initial_guess(self, guess):
+        if guess is None:
+            guess = estimate_parameters(self.df_100, self.sample_data)
+            print(f'Analytic estimate: k = {guess[0]:.4} m^2, n = {guess[1]:.4}')
+        return guess
+
     def get_solution(self):
         df = pd.read_csv(os.path.join(self.path_sim, self.file_name + '.csv'),
                          nrows=10, sep=':', index_col=0, header=None)
         return [float(df.loc['k', 1]), float(df.loc['n', 1])]
 
-    def set_adjusted_data(self):
-        data = Data(self.path)
+    def set_adjusted_data(self, config=None):
+        data = Data(self.path, config or self.config, self.interactive)
         self.df_100, self.df_final = data.adjusted_pressure_file()
         self.sample_data = data.sample_data()
 
-    def set_data(self):
-        data = Data(self.path)
+    def set_data(self, config=None):
+        data = Data(self.path, config or self.config, self.interactive)
         self.df_100, self.df_final = data.new_pressure_file()
         self.sample_data = data.sample_data()
 
+    def interpolate(self, config=None):
+        return Data(self.path, config or self.config, self.interactive).interpolate(self.df_final)
+
     def add_results(self, result, guess):
         try:
             porosity = result.x[1]
@@ -313,7 +506,7 @@ class Measurement:
 
 class MeasurementReaktor(Measurement):
 
-    def calculate_permeability(self, guess, parameter='k'):
+    def calculate_permeability(self, guess=None, parameter='k'):
         if self.find_file():
             user_input = input('Bereits angepasste Messdaten nutzen? (y/n)')
             if user_input == 'y':
@@ -322,7 +515,8 @@ class MeasurementReaktor(Measurement):
                 self.set_data()
         else:
             self.set_data()
-        result = Optimizer(self.df_100, self.sample_data, guess)
+        guess = self.get_initial_guess(guess)
+        result = Optimizer(self.df_100, self.sample_data, guess, self.config, self.cache)
         result, opt_steps = result.nelder_mead(parameter)
 
         plot = PlotterReaktor(self.df_100, **{'name': self.file_name})
@@ -334,13 +528,16 @@ class MeasurementReaktor(Measurement):
             self.save_adjusted_measurement_file()
             self.save_results()
 
-    def set_data(self):
-        data = DataReaktor(self.path)
+    def set_data(self, config=None):
+        data = DataReaktor(self.path, config or self.config, self.interactive)
         self.df_100, self.df_final = data.new_pressure_file()
         self.sample_data = data.sample_data()
 
-    def set_adjusted_data(self):
-        data = DataReaktor(self.path)
+    def interpolate(self, config=None):
+        return DataReaktor(self.path, config or self.config, self.interactive).interpolate(self.df_final)
+
+    def set_adjusted_data(self, config=None):
+        data = DataReaktor(self.path, config or self.config, self.interactive)
         self.df_100, self.df_final = data.adjusted_pressure_file()
         self.sample_data = data.sample_data()
 
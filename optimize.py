@@ -1,64 +1,375 @@
-from linear_system import LinearSystem
+from concurrent.futures import ProcessPoolExecutor
+from gas_properties import PropertyError
+from linear_system import LinearSystem, BatchLinearSystem
+from profiling import profiled
 import numpy as np
 import pandas as pd
 import scipy.optimize as optimize
+from scipy.stats import qmc
+from settings import SolverConfig
+
+
+class SimplexBudget:
+    # follows the function values of the Nelder-Mead simplex of scipy, which only depend on the values the
+    # objective returns; a candidate may only be stopped when its error is above every value it is compared
+    # with and it is not kept in the simplex, then infinity leads to the same step as its error
+
+    def __init__(self, number_of_vertices):
+        self.number_of_vertices = number_of_vertices
+        self.values = []
+        self.step = 'initial'
+        self.reflected = None
+
+    def budget(self):
+        # the vertices of the initial simplex and of a shrink are kept whatever their error
+        if self.step in ['initial', 'shrink']:
+            return np.inf
+        # the expansion and the outside contraction are compared with the reflected point, the reflection
+        # and the inside contraction with the worst vertex
+        if self.step in ['expansion', 'outside_contraction']:
+            return self.reflected
+        return self.values[-1]
+
+    def add(self, value):
+        if self.step in ['initial', 'shrink']:
+            self.values.append(value)
+            if len(self.values) == self.number_of_vertices:
+                self.values.sort()
+                self.step = 'reflection'
+        elif self.step == 'reflection':
+            if value < self.values[0]:
+                self.step, self.reflected = 'expansion', value
+            elif value < self.values[-2]:
+                self.replace_worst(value)
+            elif value < self.values[-1]:
+                self.step, self.reflected = 'outside_contraction', value
+            else:
+                self.step = 'inside_contraction'
+        elif self.step == 'expansion':
+            self.replace_worst(min(value, self.reflected))
+        elif self.step == 'outside_contraction' and value <= self.reflected \
+                or self.step == 'inside_contraction' and value < self.values[-1]:
+            self.replace_worst(value)
+        else:
+            # the best vertex stays, the others are evaluated again
+            self.values = self.values[:1]
+            self.step = 'shrink'
+
+    def replace_worst(self, value):
+        self.values[-1] = value
+        self.values.sort()
+        self.step = 'reflection'
 
 
 class Optimizer:
+    # log10(k) and n
+    log_bounds = [(-25, -10), (1e-4, 1)]
+    log_steps = [0.25, 0.05]
 
-    def __init__(self, df_100, sample_data, guess):
+    def __init__(self, df_100, sample_data, guess, config=SolverConfig(), cache=None, prefix_store=None,
+                 error_budget=None):
+        # error_budget is the factor on the best error so far above which the simulation of a candidate is
+        # stopped, if the Nelder-Mead step it belongs to does not depend on its error; None simulates every
+        # candidate completely
+        if error_budget is not None and error_budget < 1:
+            raise ValueError('The error budget must be at least the best error.')
         self.df_100 = df_100
         self.sample_data = sample_data
         self.guess = guess
+        self.config = config
+        self.cache = cache
+        self.prefix_store = prefix_store
+        self.error_budget = error_budget
+        self.best_error = np.inf
+        self.simplex = None
         self.data = None
         self.optimization_steps = [['k', 'n', 'e']]
 
-    def nelder_mead(self, parameter):
+    def nelder_mead(self, parameter, initial_simplex=None):
         if parameter == 'k':
+            self.simplex = SimplexBudget(2)
             min_result = optimize.minimize(self.optimize_function, self.guess[0], args=parameter,
-                                           method='Nelder-Mead', options={'disp': False}, tol=0.001)
+                                           method='Nelder-Mead', tol=0.001,
+                                           options={'disp': False, 'initial_simplex': initial_simplex})
         elif parameter == 'both':
+            self.simplex = SimplexBudget(3)
             min_result = optimize.minimize(self.optimize_function, self.guess, args=parameter,
-                                           method='Nelder-Mead', options={'disp': False}, tol=0.001)
+                                           method='Nelder-Mead', tol=0.001,
+                                           options={'disp': False, 'initial_simplex': initial_simplex})
+        self.simplex = None
+
+        if self.data.get('aborted'):
+            # the last candidate was stopped early, the calculated pressures are those of the result
+            self.data = self.simulate([min_result.x[0], self.guess[1]] if parameter == 'k' else min_result.x)
+        self.print_final_result(min_result)
+        self.set_calculated_pressure()
+
+        return min_result, self.optimization_steps
+
+    def multi_start(self, parameter, number_of_starts=8, design='sobol', spread=1.5, rounds=3,
+                    evaluations_per_round=15, lag_tolerance=1, workers=None, seed=0):
+        # Nelder-Mead in log10(k) and bounded n from several starts around the guess; all running starts
+        # get a budget of evaluations per round, after which the worse half, starts whose error is more than
+        # lag_tolerance above the best one and starts that have run into a better one are stopped, the rest
+        # continue from their simplex and the last round runs until convergence
+        starts = self.initial_design(parameter, number_of_starts, design, spread, seed)
+        running = [(start, None) for start in starts]
+        finished = []
+        optimization_steps = []
+        number_of_evaluations = 0
+        # one pool for all rounds, the worker processes are started once
+        executor = None if workers == 1 else ProcessPoolExecutor(max_workers=workers)
+        try:
+            for i in range(rounds):
+                last_round = i == rounds - 1
+                maximum_evaluations = np.inf if last_round else evaluations_per_round
+                arguments = [(x0, parameter, simplex, maximum_evaluations) for x0, simplex in running]
+                if executor is None:
+                    results = [self.nelder_mead_log(*argument) for argument in arguments]
+                else:
+                    results = list(executor.map(self.nelder_mead_log, *zip(*arguments)))
+
+                running = []
+                best_error = min(result.fun for result, _ in results)
+                # the starts in the worker processes only lowered the best error of their copy of the optimizer
+                self.best_error = min(self.best_error, best_error)
+                for min_result, steps in sorted(results, key=lambda result: result[0].fun):
+                    number_of_evaluations += min_result.nfev
+                    optimization_steps.extend(steps)
+                    lagging = min_result.fun > best_error * (1 + lag_tolerance)
+                    duplicate = any(np.all(abs(min_result.x - x) < np.array(self.log_steps[:len(x)]) / 10)
+                                    for x, _ in running)
+                    if (last_round or min_result.status == 0 or lagging or duplicate
+                            or len(running) >= max(1, len(results) // 2)):
+                        finished.append(min_result)
+                    else:
+                        running.append((min_result.x, min_result.final_simplex[0]))
+                print(f'Round {i + 1}: best e = {best_error:.4} %, '
+                      f'{len(running)} of {len(results)} starts continue')
+                if not running:
+                    break
+        finally:
+            if executor is not None:
+                executor.shutdown()
 
+        min_result = min(finished, key=lambda result: result.fun)
+        guess = self.from_log(min_result.x, parameter)
+        min_result.x = np.array(guess[:len(min_result.x)])
+        min_result.nfev = number_of_evaluations
+        self.optimization_steps.extend(optimization_steps)
         self.print_final_result(min_result)
+        self.data = self.simulate(guess)
+        self.set_calculated_pressure()
+
+        return min_result, self.optimization_steps
+
+    def initial_design(self, parameter, number_of_starts, design, spread, seed):
+        # space-filling starts in log10(k) +- spread decades around the guess and, for 'both', the whole
+        # porosity range
+        center = self.to_log(self.guess, parameter)
+        lower = [max(center[0] - spread, self.log_bounds[0][0]), self.log_bounds[1][0]][:len(center)]
+        upper = [min(center[0] + spread, self.log_bounds[0][1]), self.log_bounds[1][1]][:len(center)]
+        if design == 'sobol':
+            sampler = qmc.Sobol(len(center), seed=seed)
+        elif design == 'lhs':
+            sampler = qmc.LatinHypercube(len(center), seed=seed)
+        else:
+            raise ValueError(f'Unknown design: {design}')
+        starts = qmc.scale(sampler.random(number_of_starts), lower, upper)
+        # the guess itself is always one of the starts
+        starts[0] = center
+        return starts
+
+    def nelder_mead_log(self, x0, parameter, initial_simplex=None, maximum_evaluations=np.inf, xatol=1e-3,
+                        fatol=1e-3):
+        # np.inf runs until the tolerances are met, scipy would otherwise stop after 200 evaluations per
+        # dimension
+        if initial_simplex is None:
+            initial_simplex = self.log_simplex(x0, self.log_steps)
+        first_step = len(self.optimization_steps)
+        self.simplex = SimplexBudget(len(x0) + 1)
+        min_result = optimize.minimize(self.optimize_function_log, x0, args=parameter, method='Nelder-Mead',
+                                       bounds=self.log_bounds[:len(x0)],
+                                       options={'xatol': xatol, 'fatol': fatol, 'maxfev': maximum_evaluations,
+                                                'maxiter': np.inf, 'initial_simplex': initial_simplex})
+        self.simplex = None
+        # the steps are collected by multi_start, also when the starts run in this process
+        steps = self.optimization_steps[first_step:]
+        del self.optimization_steps[first_step:]
+        return min_result, steps
+
+    def log_simplex(self, x0, steps):
+        # steps toward the middle of the bounds, so the simplex stays inside
+        steps = [step if x < (low + high) / 2 else -step for x, step, (low, high) in
+                 zip(x0, steps, self.log_bounds)]
+        return np.vstack([x0, x0 + np.diag(steps)])
+
+    def optimize_function_log(self, x, parameter):
+        return self.optimize_function(self.from_log(x, parameter), 'both')
+
+    def to_log(self, guess, parameter):
+        if parameter == 'k':
+            return np.array([np.log10(guess[0])])
+        return np.array([np.log10(guess[0]), guess[1]])
+
+    def from_log(self, x, parameter):
+        if parameter == 'k':
+            return [10 ** x[0], self.guess[1]]
+        return [10 ** x[0], x[1]]
+
+    def lbfgs(self, parameter):
+        x0 = [np.log10(self.guess[0]), self.guess[1]]
+        bounds = [(-25, -10), (1e-4, 1)]
+        if parameter == 'k':
+            x0, bounds = x0[:1], bounds[:1]
+        min_result = optimize.minimize(self.optimize_function_gradient, x0, args=parameter, jac=True,
+                                       method='L-BFGS-B', bounds=bounds, options={'ftol': 1e-3})
+        min_result.x[0] = 10 ** min_result.x[0]
 
+        self.print_final_result(min_result)
+        self.set_calculated_pressure()
+
+        return min_result, self.optimization_steps
+
+    def set_calculated_pressure(self):
         self.df_100[['Inlet_Pressure_Cal', 'Outlet_Pressure_Cal']] = None
         self.df_100['Inlet_Pressure_Cal'] = pd.DataFrame.from_dict(self.data['inlet_pressure_calculated'])
         self.df_100['Outlet_Pressure_Cal'] = pd.DataFrame.from_dict(self.data['outlet_pressure_calculated'])
 
-        return min_result, self.optimization_steps
-
+    @profiled('objective')
     def optimize_function(self, guess, parameter):
         if parameter == 'k':
             guess = [guess[0], self.guess[1]]
         elif parameter == 'both':
             guess = guess
 
-        self.data = LinearSystem(self.df_100, self.sample_data, guess).solve_linear_system()
+        error_budget = None
+        if self.error_budget is not None and self.simplex is not None:
+            error_budget = max(self.error_budget * self.best_error, self.simplex.budget())
+        try:
+            self.data = self.simulate(guess, error_budget)
+        except PropertyError as ex:
+            # CoolProp cannot evaluate the pressures of a non-physical candidate
+            print(f'k = {guess[0]:.4} m^2, n = {guess[1]:.4}, Exception {type(ex).__name__}, {ex.args}')
+            error = np.inf
+        else:
+            error = self.calculate_error()
+            if self.data.get('aborted'):
+                # only a lower bound of the error, which is above every value of the simplex it is compared with
+                print(f'k = {guess[0]:.4} m^2, n = {guess[1]:.4}, e > {error:.3} % '
+                      f'(stopped after {len(self.data["iterations"])} time steps)')
+                error = np.inf
+            else:
+                self.best_error = min(self.best_error, error)
+                self.optimization_steps.append([guess[0], guess[1], error/100])
+                print(f'k = {guess[0]:.4} m^2, n = {guess[1]:.4}, e = {error:.3} %')
+        if self.simplex is not None:
+            self.simplex.add(error)
+        return error
+
+    def simulate(self, guess, error_budget=None):
+        # stopped simulations are neither cached nor continued
+        if self.cache is None:
+            return self.simulate_from_prefix(guess, error_budget)
+
+        key = self.cache.key(self.df_100, self.sample_data, guess, self.config)
+        data = self.cache.get(key)
+        if data is None:
+            data = self.simulate_from_prefix(guess, error_budget)
+            if not data['aborted']:
+                self.cache.put(key, data)
+        return data
+
+    def simulate_from_prefix(self, guess, error_budget=None):
+        if self.prefix_store is None:
+            return LinearSystem(self.df_100, self.sample_data, guess, self.config).solve_linear_system(
+                error_budget=error_budget)
+
+        system = LinearSystem(self.df_100, self.sample_data, guess, self.config)
+        key = self.prefix_store.key(guess, system.get_conditions(), self.config)
+        data = system.solve_linear_system(self.prefix_store.get(key), error_budget)
+        if not data['aborted']:
+            self.prefix_store.put(key, data)
+        return data
+
+    @staticmethod
+    def warm_start_simplex(final_simplex, minimum_size=0.01):
+        # reuse the converged simplex of a previous fit, widened so that it can still move
+        best = final_simplex[0]
+        offsets = final_simplex[1:] - best
+        size = np.maximum(abs(offsets).max(axis=0), np.finfo(float).tiny)
+        scale = np.maximum(1, minimum_size * abs(best) / size)
+        return np.vstack([best, best + offsets * scale])
+
+    @profiled('objective')
+    def optimize_function_gradient(self, x, parameter):
+        if parameter == 'k':
+            guess = [10 ** x[0], self.guess[1]]
+        elif parameter == 'both':
+            guess = [10 ** x[0], x[1]]
+
+        system = LinearSystem(self.df_100, self.sample_data, guess, self.config)
+        try:
+            self.data = system.solve_linear_system()
+        except PropertyError as ex:
+            # CoolProp cannot evaluate the pressures of a non-physical trial point
+            print(f'k = {guess[0]:.4} m^2, n = {guess[1]:.4}, Exception {type(ex).__name__}, {ex.args}')
+            return np.inf, np.zeros(len(x))
         error = self.calculate_error()
+        gradient = system.calculate_gradient(self.calculate_error_gradient())
+        gradient[0] = gradient[0] * np.log(10)
         self.optimization_steps.append([guess[0], guess[1], error/100])
         print(f'k = {guess[0]:.4} m^2, n = {guess[1]:.4}, e = {error:.3} %')
-        return error
+        return error, gradient[:len(x)]
+
+    @profiled('objective')
+    def evaluate_batch(self, guesses):
+        guesses = np.atleast_2d(guesses)
+        self.data = BatchLinearSystem(self.df_100, self.sample_data, guesses, self.config).solve_linear_system()
+        errors = self.calculate_error()
+        self.optimization_steps.extend([[k, n, error/100] for (k, n), error in zip(guesses, errors)])
+        return errors
 
     def calculate_error(self):
         p_in_ref = self.data['inlet_pressure']
         p_in = self.data['inlet_pressure_calculated']
         p_out_ref = self.data['outlet_pressure']
         p_out = self.data['outlet_pressure_calculated']
+        # a stopped simulation only has the first time levels, the magnitude is that of the whole measurement
+        levels = p_in.shape[-1]
 
         if self.sample_data['outlet_chamber_volume'] == 0:
             absolute_magnitude = np.sqrt(sum(p_in_ref ** 2))
-            difference = abs(p_in_ref - p_in)
-            absolute_error = np.sqrt(sum(difference ** 2))
+            difference = abs(p_in_ref[:levels] - p_in)
+            absolute_error = np.sqrt(np.sum(difference ** 2, axis=-1))
             relative_error = absolute_error / absolute_magnitude * 100
         else:
             absolute_magnitude = np.sqrt(sum(p_in_ref**2 + p_out_ref**2))
-            difference = abs(p_in_ref - p_in) + abs(p_out_ref - p_out)
-            absolute_error = np.sqrt(sum(difference**2))
+            difference = abs(p_in_ref[:levels] - p_in) + abs(p_out_ref[:levels] - p_out)
+            absolute_error = np.sqrt(np.sum(difference**2, axis=-1))
             relative_error = absolute_error / absolute_magnitude * 100
         return relative_error
 
+    def calculate_error_gradient(self):
+        # derivative of calculate_error with respect to the calculated pressure of every cell and time level
+        inlet_deviation = self.data['inlet_pressure_calculated'] - self.data['inlet_pressure']
+        outlet_deviation = self.data['outlet_pressure_calculated'] - self.data['outlet_pressure']
+        pressure_gradient = np.zeros(self.data['cell_pressure_history'].shape)
+
+        if self.sample_data['outlet_chamber_volume'] == 0:
+            absolute_magnitude = np.sqrt(np.sum(self.data['inlet_pressure'] ** 2))
+            difference = abs(inlet_deviation)
+            pressure_gradient[:, 0] = np.sign(inlet_deviation)
+        else:
+            absolute_magnitude = np.sqrt(np.sum(self.data['inlet_pressure']**2 + self.data['outlet_pressure']**2))
+            difference = abs(inlet_deviation) + abs(outlet_deviation)
+            pressure_gradient[:, 0] = np.sign(inlet_deviation)
+            pressure_gradient[:, -1] = np.sign(outlet_deviation)
+
+        # an exact fit has no gradient, the error is not differentiable there
+        absolute_error = max(np.sqrt(np.sum(difference**2)), np.finfo(float).tiny)
+        return pressure_gradient * (difference / absolute_error / absolute_magnitude * 100)[:, np.newaxis]
+
     @staticmethod
     def print_final_result(min_result):
         print(f'\n Calculation finished: {min_result.message} \n'
@@ -0,0 +1,146 @@
+import contextvars
+import functools
+import json
+import time
+import numpy as np
+import pandas as pd
+
+# the profiler of the calling thread; threads started during a fit begin without one, worker processes too
+active_profiler = contextvars.ContextVar('active_profiler', default=None)
+
+
+def profiled(section):
+    # methods are timed in the section of the active profiler, without one they are called directly; nothing
+    # is replaced at run time, so concurrent fits and a failing fit leave the classes as they are
+    def decorator(function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            profiler = active_profiler.get()
+            if profiler is None:
+                return function(*args, **kwargs)
+            return profiler.time(section, function, *args, **kwargs)
+        return timed
+    return decorator
+
+
+class Profiler:
+
+    def __init__(self, name='fit'):
+        self.name = name
+        self.timings = {}
+        self.solves = []
+        self.steps = []
+        self.stack = []
+        self.token = None
+        self.start = None
+        self.stop = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *exception):
+        self.disable()
+
+    def enable(self):
+        if active_profiler.get() is not None:
+            raise RuntimeError('Another profiler is already active.')
+        self.token = active_profiler.set(self)
+        self.start = time.perf_counter()
+        self.stop = None
+
+    def disable(self):
+        self.stop = time.perf_counter()
+        active_profiler.reset(self.token)
+        self.token = None
+
+    def time(self, section, function, *args, **kwargs):
+        # the time of nested sections is subtracted from the own time of the calling section
+        self.stack.append(0)
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self.stack.pop()
+            if self.stack:
+                self.stack[-1] += elapsed
+            self.record(section, elapsed, elapsed - nested)
+        if section == 'forward_solve':
+            self.record_solve(result, elapsed)
+        return result
+
+    def record(self, section, elapsed, own):
+        timing = self.timings.setdefault(section, [0, 0, 0])
+        timing[0] += 1
+        timing[1] += elapsed
+        timing[2] += own
+
+    def record_solve(self, data, elapsed):
+        iterations = np.asarray(data['iterations'])
+        converged = np.asarray(data['converged'])
+        # a step of a batch counts as converged when it converged for every guess
+        converged = converged.reshape(-1, converged.shape[-1]).all(axis=0)
+        for step, (step_iterations, step_converged) in enumerate(zip(iterations, converged)):
+            self.steps.append({'solve': len(self.solves), 'step': step,
+                               'nonlinear_iterations': int(step_iterations), 'converged': bool(step_converged)})
+        self.solves.append({'time_steps': len(iterations),
+                            'nonlinear_iterations': int(iterations.sum()),
+                            'maximum_iterations': int(iterations.max(initial=0)),
+                            'non_converged_steps': int(np.count_nonzero(~np.asarray(data['converged']))),
+                            'aborted': bool(data.get('aborted', False)),
+                            'wall_time': elapsed})
+
+    def wall_time(self):
+        return (self.stop or time.perf_counter()) - self.start
+
+    def section_table(self):
+        df = pd.DataFrame([[section, *timing] for section, timing in self.timings.items()],
+                          columns=['section', 'calls', 'total_time', 'own_time'])
+        df['share'] = df['own_time'] / self.wall_time()
+        return df.sort_values('own_time', ascending=False, ignore_index=True)
+
+    def solve_table(self):
+        return pd.DataFrame(self.solves, columns=['time_steps', 'nonlinear_iterations', 'maximum_iterations',
+                                                  'non_converged_steps', 'aborted', 'wall_time'])
+
+    def step_table(self):
+        return pd.DataFrame(self.steps, columns=['solve', 'step', 'nonlinear_iterations', 'converged'])
+
+    def summary(self):
+        solves = self.solve_table()
+        forward_solves = self.timings.get('forward_solve', [0])[0]
+        return {'name': self.name,
+                'wall_time': self.wall_time(),
+                'forward_solves': forward_solves,
+                'failed_forward_solves': forward_solves - len(solves),
+                'aborted_forward_solves': int(solves['aborted'].sum()),
+                'objective_evaluations': self.timings.get('objective', [0])[0],
+                'time_steps': int(solves['time_steps'].sum()),
+                'nonlinear_iterations': int(solves['nonlinear_iterations'].sum()),
+                'non_converged_steps': int(solves['non_converged_steps'].sum()),
+                'sections': self.section_table().to_dict(orient='records')}
+
+    def to_json(self, path):
+        report = self.summary()
+        report['solves'] = self.solve_table().to_dict(orient='records')
+        report['steps'] = self.step_table().to_dict(orient='records')
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    def to_csv(self, path):
+        # one table per file, path without extension, e.g. sim_data/HY_S01_profile
+        self.section_table().to_csv(path + '_sections.csv', index=False, float_format='%.6g')
+        self.solve_table().to_csv(path + '_solves.csv', index=False, float_format='%.6g')
+        self.step_table().to_csv(path + '_steps.csv', index=False)
+
+    def report(self):
+        summary = self.summary()
+        iterations_per_step = summary['nonlinear_iterations'] / max(summary['time_steps'], 1)
+        print(f'\n Profile {self.name}: {summary["wall_time"]:.3f} s \n'
+              f'\tForward solves: {summary["forward_solves"]} ({summary["failed_forward_solves"]} failed, '
+              f'{summary["aborted_forward_solves"]} stopped early) \n'
+              f'\tObjective evaluations: {summary["objective_evaluations"]} \n'
+              f'\tNonlinear iterations per time step: {iterations_per_step:.2f} \n'
+              f'\tNon-converged time steps: {summary["non_converged_steps"]}')
+        print(self.section_table().to_string(index=False, float_format='%.4f'))
@@ -0,0 +1,88 @@
+import numpy as np
+import scipy.optimize
+
+from gas_properties import PropertyTable
+
+
+def first_eigenvalue(a, b):
+    # first root of the Dicker-Smits equation tan(theta) = (a+b)*theta / (theta^2 - a*b),
+    # b = inf is a closed outlet end (no outlet chamber)
+    if np.isinf(b):
+        function = lambda theta: - a * np.sin(theta) - theta * np.cos(theta)
+    else:
+        function = lambda theta: (theta**2 - a*b) * np.sin(theta) - (a + b) * theta * np.cos(theta)
+    theta = np.linspace(1e-9, np.pi, 1001)
+    values = function(theta)
+    i = np.flatnonzero(np.sign(values[1:]) != np.sign(values[:-1]))[0]
+    return scipy.optimize.brentq(function, theta[i], theta[i+1])
+
+
+def decay_rate(time, deviation):
+    ratio = deviation / deviation[0]
+    # skip the early time, where higher modes still contribute, and the noisy tail
+    window = (ratio > 0.05) & (ratio < 0.8)
+    if np.count_nonzero(window) < 3:
+        window = (ratio > 0) & (time > time[0])
+    slope, _ = np.polyfit(time[window], np.log(ratio[window]), 1)
+    if not slope < 0:
+        raise ValueError('The pressure pulse has not decayed, no analytic estimate possible.')
+    return -slope
+
+
+def equilibrium_mass(time, chamber_mass, rates):
+    # least squares fit of chamber_mass = mass_inf + amplitude * exp(-rate * t) for every rate at once
+    basis = np.exp(-np.outer(rates, time))
+    basis_mean = basis.mean(axis=1, keepdims=True)
+    mass_mean = chamber_mass.mean()
+    amplitude = (((basis - basis_mean) * (chamber_mass - mass_mean)).sum(axis=1)
+                 / ((basis - basis_mean)**2).sum(axis=1))
+    mass_inf = mass_mean - amplitude * basis_mean[:, 0]
+    residual = ((mass_inf[:, np.newaxis] + amplitude[:, np.newaxis] * basis - chamber_mass)**2).sum(axis=1)
+    return mass_inf, residual
+
+
+def estimate_parameters(df, sample_data, porosity=None):
+    time = np.asarray(df['Duration'], dtype=float)
+    inlet_pressure = np.asarray(df['Inlet_Pressure'], dtype=float)
+    outlet_pressure = np.asarray(df['Outlet_Pressure'], dtype=float)
+    table = PropertyTable.get(sample_data['gas'], np.mean(df['Temperature']))
+    length = sample_data['length']
+    area = sample_data['area']
+    inlet_volume = sample_data['inlet_chamber_volume']
+    outlet_volume = sample_data['outlet_chamber_volume']
+
+    _, _, inlet_density = table.lookup(inlet_pressure)
+    _, _, outlet_density = table.lookup(outlet_pressure)
+    chamber_mass = inlet_volume * inlet_density + outlet_volume * outlet_density
+
+    if outlet_volume == 0:
+        # the inlet decays towards an unknown equilibrium, alternate between the decay rate and the
+        # equilibrium mass, starting from the best fit over a wide range of rates
+        rates = np.geomspace(1e-9, 1, 2000) / (time[0] + 1)
+        mass_inf, residual = equilibrium_mass(time, chamber_mass, rates)
+        mass_inf = mass_inf[np.argmin(residual)]
+        for _ in range(10):
+            rate = decay_rate(time, chamber_mass - mass_inf)
+            late = time >= time[np.argmax((chamber_mass - mass_inf) < 0.8 * (chamber_mass[0] - mass_inf))]
+            mass_inf = equilibrium_mass(time[late], chamber_mass[late], np.array([rate]))[0][0]
+        mean_pressure = inlet_pressure
+    else:
+        rate = decay_rate(time, inlet_pressure - outlet_pressure)
+        mass_inf = equilibrium_mass(time, chamber_mass, np.array([rate]))[0][0]
+        mean_pressure = (inlet_pressure + outlet_pressure) / 2
+
+    if porosity is None:
+        # mass balance: the gas that left the chambers fills the pore volume up to the equilibrium pressure
+        density_inf = mass_inf / (inlet_volume + outlet_volume)
+        _, _, sample_density = table.lookup(outlet_pressure[:1])
+        pore_volume = (chamber_mass[0] - mass_inf) / (density_inf - sample_density[0])
+        porosity = float(np.clip(pore_volume / (area * length), 1e-4, 0.5))
+
+    pore_volume = porosity * area * length
+    a = pore_volume / inlet_volume
+    b = pore_volume / outlet_volume if outlet_volume > 0 else np.inf
+    theta = first_eigenvalue(a, b)
+
+    compressibility, viscosity, _ = table.lookup(np.array([mean_pressure.mean()]))
+    permeability = rate * viscosity[0] * compressibility[0] * porosity * length**2 / theta**2
+    return [float(permeability), porosity]
@@ -0,0 +1,143 @@
+import os
+import threading
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class Sensor:
+    range: float
+    error: float
+
+
+@dataclass(frozen=True)
+class MeasurementUnit:
+    number: int
+    name: str
+    inlet_chamber_volume: float
+    outlet_chamber_volume: float
+
+
+@dataclass(frozen=True)
+class CoreSample:
+    name: str
+    length: float
+    diameter: float
+    unit: int
+    gas: str
+    inlet_sensor: Sensor = None
+    outlet_sensor: Sensor = None
+
+    @property
+    def area(self):
+        return np.pi * 0.25 * self.diameter**2
+
+
+@dataclass(frozen=True)
+class ReaktorSample:
+    name: str
+    length: float
+    outer_diameter: float
+    inner_diameter: float
+    unit: int
+    gas: str
+
+    @property
+    def area(self):
+        return np.pi * 0.25 * (self.outer_diameter**2 - self.inner_diameter**2)
+
+
+class SampleRegistry:
+    files = {'core': 'database.csv', 'reaktor': 'database_reaktor.csv', 'units': 'measurement_units.csv'}
+    required_columns = {'core': ['name', 'length', 'diameter', 'unit', 'gas'],
+                        'reaktor': ['name', 'length', 'outer_diameter', 'inner_diameter', 'unit', 'gas'],
+                        'units': ['number', 'name', 'inlet_chamber_in_ml', 'outlet_chamber_in_ml']}
+    registries = {}
+    lock = threading.Lock()
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.modification_times = self.get_modification_times()
+        self.units = {}
+        self.cores = {}
+        self.reaktors = {}
+        self.load()
+
+    @classmethod
+    def get(cls, directory='.'):
+        # one registry per directory, loaded again only when one of the tables has been modified
+        directory = os.path.abspath(directory)
+        with cls.lock:
+            registry = cls.registries.get(directory)
+            if registry is None or registry.modification_times != registry.get_modification_times():
+                registry = cls.registries[directory] = cls(directory)
+            return registry
+
+    def get_modification_times(self):
+        return {table: os.stat(os.path.join(self.directory, file)).st_mtime_ns for table, file in self.files.items()}
+
+    def read_table(self, table):
+        df = pd.read_csv(os.path.join(self.directory, self.files[table]), sep=' ')
+        missing = [column for column in self.required_columns[table] if column not in df.columns]
+        if missing:
+            raise ValueError(f'{self.files[table]} has no column {", ".join(missing)}')
+        df = df.dropna(subset=['name'])
+        duplicates = df['name'][df['name'].duplicated()]
+        if len(duplicates):
+            print(f'{self.files[table]}: duplicate entries {", ".join(duplicates)}, the first one is used.')
+        return df.drop_duplicates(subset=['name'])
+
+    def load(self):
+        ml_to_m3 = 1e-6
+        for row in self.read_table('units').itertuples(index=False):
+            self.units[int(row.number)] = MeasurementUnit(int(row.number), row.name,
+                                                          row.inlet_chamber_in_ml * ml_to_m3,
+                                                          row.outlet_chamber_in_ml * ml_to_m3)
+
+        for row in self.read_table('core').itertuples(index=False):
+            self.add(self.cores, 'core', row, lambda: CoreSample(
+                row.name, float(row.length), float(row.diameter), int(row.unit), row.gas,
+                self.parse_sensor(getattr(row, 'uncertainty_inlet', None)),
+                self.parse_sensor(getattr(row, 'uncertainty_outlet', None))))
+
+        for row in self.read_table('reaktor').itertuples(index=False):
+            self.add(self.reaktors, 'reaktor', row, lambda: ReaktorSample(
+                row.name, float(row.length), float(row.outer_diameter), float(row.inner_diameter),
+                int(row.unit), row.gas))
+
+    def add(self, samples, table, row, create):
+        # an invalid row is left out like a duplicate, one broken entry must not block every other sample
+        try:
+            sample = self.validate(create())
+        except ValueError as error:
+            print(f'{self.files[table]}: {row.name} is skipped, {error}')
+            return
+        samples[sample.name] = sample
+
+    def validate(self, sample):
+        if sample.unit not in self.units:
+            raise ValueError(f'measurement unit {sample.unit} is not in {self.files["units"]}')
+        if not (sample.length > 0 and sample.area > 0):
+            raise ValueError('the sample dimensions must be positive')
+        return sample
+
+    @staticmethod
+    def parse_sensor(uncertainty):
+        # 'range*error', e.g. 200e5*0.0055, samples without uncertainties have no sensor record
+        if not isinstance(uncertainty, str):
+            return None
+        measuring_range, error = uncertainty.split('*')
+        return Sensor(float(measuring_range), float(error))
+
+    def core(self, name):
+        return self.cores[name]
+
+    def reaktor(self, name):
+        return self.reaktors[name]
+
+    def unit(self, number):
+        return self.units[number]
+
+    def names(self):
+        return list(self.cores), list(self.reaktors)
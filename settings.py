@@ -1,7 +1,39 @@
-def init():
-    global viscosity_multiplier
-    viscosity_multiplier = 1
-    global density_multiplier
-    density_multiplier = 1
-    global compressibility_multiplier
-    compressibility_multiplier = 1
\ No newline at end of file
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class SolverConfig:
+    number_of_cells: int = 50
+    mesh: str = 'uniform'
+    mesh_stretching: float = 2
+    number_of_time_steps: int = 100
+    property_backend: str = 'table'
+    linear_solver: str = 'banded'
+    nonlinear_solver: str = 'picard'
+    nonlinear_tolerance: float = 1e-5
+    maximum_iterations: int = 11
+    time_integration: str = 'backward_euler'
+    time_stepping: str = 'fixed'
+    time_step_tolerance: float = 1e-2
+    viscosity_multiplier: float = 1
+    density_multiplier: float = 1
+    compressibility_multiplier: float = 1
+
+    options = {'mesh': ['original', 'uniform', 'graded'],
+               'property_backend': ['table', 'coolprop'],
+               'linear_solver': ['banded', 'thomas', 'sparse'],
+               'nonlinear_solver': ['picard', 'newton'],
+               'time_integration': ['backward_euler', 'bdf2', 'crank_nicolson'],
+               'time_stepping': ['fixed', 'adaptive']}
+
+    def __post_init__(self):
+        # a mistake in the configuration fails here and not as an error of every candidate of a fit
+        for name, values in self.options.items():
+            if getattr(self, name) not in values:
+                raise ValueError(f'Unknown {name.replace("_", " ")}: {getattr(self, name)}')
+        if self.time_stepping == 'adaptive' and self.time_integration != 'bdf2':
+            raise ValueError('Adaptive time stepping is only implemented for BDF2.')
+        if not self.mesh_stretching > 0:
+            raise ValueError('The mesh stretching must be positive.')
+        if self.number_of_cells < 3:
+            raise ValueError('The sample needs at least one cell between the chambers.')
@@ -0,0 +1,173 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+class SimulationCache:
+    # part of every key, raised when a configuration gives different results than before, so the disk tier
+    # does not return simulations of the old model
+    model_version = 2
+
+    def __init__(self, maximum_entries=256, directory=None, maximum_disk_size=500e6, significant_digits=6):
+        self.maximum_entries = maximum_entries
+        self.directory = directory
+        self.maximum_disk_size = maximum_disk_size
+        self.significant_digits = significant_digits
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __getstate__(self):
+        # worker processes get the configuration and share only the disk tier
+        state = self.__dict__.copy()
+        state.update({'memory': OrderedDict(), 'lock': None, 'hits': 0, 'disk_hits': 0, 'misses': 0})
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def key(self, df_100, sample_data, guess, config):
+        key = hashlib.sha256(f'model {self.model_version} '.encode())
+        for column in ['Duration', 'Inlet_Pressure', 'Outlet_Pressure', 'Temperature']:
+            key.update(np.ascontiguousarray(df_100[column].values, dtype=float).tobytes())
+        geometry = [sample_data.get(name) for name in ['length', 'area', 'inlet_chamber_volume',
+                                                       'outlet_chamber_volume', 'gas', 'temperature']]
+        key.update(repr([str(value) for value in geometry]).encode())
+        key.update(repr(config).encode())
+        key.update(' '.join(f'{float(value):.{self.significant_digits - 1}e}' for value in guess).encode())
+        return key.hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return dict(self.memory[key])
+
+        data = self.load(key)
+        with self.lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self.store_in_memory(key, data)
+        return dict(data)
+
+    def put(self, key, data):
+        data = self.read_only(data)
+        with self.lock:
+            self.store_in_memory(key, data)
+        if self.directory is not None:
+            self.save(key, data)
+
+    @staticmethod
+    def read_only(data):
+        # the entries are shared by every hit, so the callers get their own dict and arrays they cannot change
+        entry = {}
+        for name, value in data.items():
+            if isinstance(value, np.ndarray):
+                value = value.copy()
+                value.flags.writeable = False
+            entry[name] = value
+        return entry
+
+    def store_in_memory(self, key, data):
+        self.memory[key] = data
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.maximum_entries:
+            self.memory.popitem(last=False)
+
+    def file_path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def load(self, key):
+        if self.directory is None:
+            return None
+        try:
+            with np.load(self.file_path(key)) as file:
+                data = self.read_only({name: file[name] for name in file.files})
+        except (OSError, ValueError):
+            return None
+        # refresh the access time that the size based eviction is ordered by
+        os.utime(self.file_path(key))
+        return data
+
+    def save(self, key, data):
+        os.makedirs(self.directory, exist_ok=True)
+        temporary_path = f'{self.file_path(key)}.{os.getpid()}.{threading.get_ident()}'
+        with open(temporary_path, 'wb') as file:
+            np.savez(file, **{name: np.asarray(value) for name, value in data.items()})
+        os.replace(temporary_path, self.file_path(key))
+        self.evict()
+
+    def evict(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, name))
+
+        disk_size = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if disk_size <= self.maximum_disk_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            disk_size -= size
+
+    def statistics(self):
+        with self.lock:
+            requests = self.hits + self.disk_hits + self.misses
+            return {'hits': self.hits,
+                    'disk_hits': self.disk_hits,
+                    'misses': self.misses,
+                    'hit_rate': (self.hits + self.disk_hits) / requests if requests else 0,
+                    'entries': len(self.memory)}
+
+
+class PrefixStore:
+    # the end states of simulations of one measurement on a window of its time grid, a candidate that is
+    # evaluated again on a longer window only solves the new time steps
+
+    def __init__(self, maximum_entries=256):
+        self.maximum_entries = maximum_entries
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(guess, conditions, config):
+        # exact, a simulation under other conditions is not continued
+        return float(guess[0]), float(guess[1]), conditions, repr(config)
+
+    def get(self, key):
+        if key not in self.memory:
+            self.misses += 1
+            return None
+        self.memory.move_to_end(key)
+        self.hits += 1
+        return self.memory[key]
+
+    def put(self, key, data):
+        # only what a longer window needs: the time grid, the calculated chamber pressures and the last two
+        # levels of the cells, which the second order schemes continue from
+        self.memory[key] = {'duration': data['duration'],
+                            'conditions': key[2],
+                            'inlet_pressure_calculated': data['inlet_pressure_calculated'],
+                            'outlet_pressure_calculated': data['outlet_pressure_calculated'],
+                            'end_pressure': data['cell_pressure_history'][..., -2:, :].copy(),
+                            'iterations': data['iterations'],
+                            'converged': data['converged']}
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.maximum_entries:
+            self.memory.popitem(last=False)
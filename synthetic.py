@@ -0,0 +1,103 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+from import_data import Data, DataReaktor
+from linear_system import LinearSystem
+from settings import SolverConfig
+
+
+class SyntheticMeasurement:
+    atmospheric_pressure = 97700
+    confining_pressure = 100
+    decimals = 4
+
+    def __init__(self, name, reaktor=False, k=2e-18, n=0.1, hours=48, pulse=50, base_pressure=0,
+                 temperature=25, noise=0.001, lead_time=600, start='10.03.2020 08:00:00', seed=0,
+                 config=SolverConfig(number_of_cells=100, number_of_time_steps=400)):
+        # a pulse-decay test of a sample of the databases with known k and n, pressures in bar (relative)
+        # and the temperature in °C as the logger writes them, sampled at 1 Hz
+        self.name = name
+        self.reaktor = reaktor
+        self.k = k
+        self.n = n
+        self.duration = int(hours * 3600)
+        self.pulse = pulse
+        self.base_pressure = base_pressure
+        self.temperature = temperature
+        self.noise = noise
+        self.lead_time = lead_time
+        self.start = pd.to_datetime(start, format='%d.%m.%Y %H:%M:%S')
+        self.seed = seed
+        self.config = config
+        data_class = DataReaktor if reaktor else Data
+        self.sample_data = data_class(name + '.txt', config, interactive=False).sample_data()
+
+    def simulate(self):
+        # the forward model on a logarithmic grid from the opening of the valve at 0 s
+        duration = np.r_[0, np.geomspace(1, self.duration, self.config.number_of_time_steps - 1)]
+        to_pascal = lambda pressure: pressure * 1e5 + self.atmospheric_pressure
+        df = pd.DataFrame({'Duration': duration,
+                           'Inlet_Pressure': to_pascal(self.base_pressure + self.pulse),
+                           'Outlet_Pressure': to_pascal(self.base_pressure),
+                           'Temperature': self.temperature + 273.15})
+        df['DateTime'] = self.start + pd.to_timedelta(self.lead_time + duration, unit='s')
+        data = LinearSystem(df, self.sample_data, [self.k, self.n], self.config).solve_linear_system()
+        df['Inlet_Pressure'] = (data['inlet_pressure_calculated'] - self.atmospheric_pressure) / 1e5
+        df['Outlet_Pressure'] = (data['outlet_pressure_calculated'] - self.atmospheric_pressure) / 1e5
+        return df
+
+    def raw_data(self):
+        df = self.simulate()
+        seconds = np.arange(-self.lead_time, self.duration + 1)
+        # the chambers are closed before the valve opens
+        elapsed = np.maximum(seconds, 0)
+        inlet = np.interp(elapsed, df['Duration'], df['Inlet_Pressure'])
+        outlet = np.interp(elapsed, df['Duration'], df['Outlet_Pressure'])
+        random = np.random.default_rng(self.seed)
+        inlet = inlet + random.normal(0, self.noise, len(seconds))
+        outlet = outlet + random.normal(0, self.noise, len(seconds))
+        temperature = self.temperature + random.normal(0, 0.01, len(seconds))
+
+        # date and time as text, built from one table of the day's seconds instead of formatting every row
+        first_day = self.start.normalize()
+        seconds_from_first_day = seconds + self.lead_time + (self.start - first_day) // pd.Timedelta(1, unit='s')
+        day, day_second = np.divmod(seconds_from_first_day, 86400)
+        clock = pd.to_datetime(np.arange(86400), unit='s').strftime('%H:%M:%S').values
+        dates = (first_day + pd.to_timedelta(np.arange(day[-1] + 1), unit='D')).strftime('%d.%m.%Y').values
+
+        df = pd.DataFrame({'Date': dates[day], 'Time': clock[day_second],
+                           'Inlet_Pressure': inlet.round(self.decimals),
+                           'Outlet_Pressure': outlet.round(self.decimals)})
+        if self.reaktor:
+            df['Confining_Pressure_Reactor'] = float(self.confining_pressure)
+            df['Confining_Pressure_Sample'] = float(self.confining_pressure)
+        else:
+            df['Confining_Pressure'] = float(self.confining_pressure)
+        df['Temperature'] = temperature.round(2)
+        return df
+
+    def write(self, directory):
+        # the layout of the measurements, raw files in raw_data and the results in sim_data beside it
+        path = os.path.join(directory, 'raw_data', self.name + '.txt')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'sim_data', 'uncertainty'), exist_ok=True)
+        self.raw_data().to_csv(path, sep=' ', index=False, float_format=f'%.{self.decimals}f')
+        return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic raw file of a sample of the databases.')
+    parser.add_argument('directory')
+    parser.add_argument('name')
+    parser.add_argument('--reaktor', action='store_true')
+    parser.add_argument('--k', type=float, default=2e-18)
+    parser.add_argument('--n', type=float, default=0.1)
+    parser.add_argument('--hours', type=float, default=48)
+    parser.add_argument('--noise', type=float, default=0.001, help='standard deviation of the pressures in bar')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    measurement = SyntheticMeasurement(args.name, args.reaktor, args.k, args.n, args.hours, noise=args.noise,
+                                       seed=args.seed)
+    print(measurement.write(args.directory))
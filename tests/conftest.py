@@ -0,0 +1,32 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+
+@pytest.fixture(autouse=True)
+def repository_directory(monkeypatch):
+    # the sample databases and the property tables are read relative to the working directory
+    monkeypatch.chdir(root)
+
+
+@pytest.fixture
+def pulse_decay_case():
+    # a hydrogen pulse decay on a logarithmic time grid with the dimensions of a core
+    duration = np.geomspace(1, 3 * 86400, 100).round(2)
+    inlet_pressure = 97700 + 50e5 - 25e5 * (1 - np.exp(-duration / 50000))
+    outlet_pressure = 97700 + 25e5 * (1 - np.exp(-duration / 50000))
+    df_100 = pd.DataFrame({'Duration': duration, 'Inlet_Pressure': inlet_pressure,
+                           'Outlet_Pressure': outlet_pressure, 'Confining_Pressure': 100e5,
+                           'Temperature': 298.15})
+    df_100['DateTime'] = pd.to_datetime(duration + 1.6e9, unit='s')
+    diameter = 0.1
+    sample_data = {'length': 0.2, 'diameter': diameter, 'area': np.pi / 4 * diameter**2, 'gas': 'H2',
+                   'inlet_sensor': {'range': 200e5, 'error': 0.0055},
+                   'outlet_sensor': {'range': 60e5, 'error': 0.0055},
+                   'inlet_chamber_volume': 164.3e-6, 'outlet_chamber_volume': 165.4e-6}
+    return df_100, sample_data
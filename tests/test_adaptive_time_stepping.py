@@ -0,0 +1,48 @@
+import dataclasses
+import numpy as np
+import pandas as pd
+import pytest
+
+from linear_system import LinearSystem
+from settings import SolverConfig
+
+guess = [1e-18, 0.05]
+
+
+def solve(df, sample_data, config, monkeypatch):
+    # the number of linear solves, including those of rejected steps
+    solves = []
+    linear_solve = LinearSystem.solve
+    with monkeypatch.context() as patch:
+        patch.setattr(LinearSystem, 'solve', lambda self, *args: solves.append(1) or linear_solve(self, *args))
+        data = LinearSystem(df, sample_data, guess, config).solve_linear_system()
+    return data, len(solves)
+
+
+def test_adaptive_steps_are_more_accurate_and_cheaper_than_fixed_steps(pulse_decay_case, monkeypatch):
+    df_100, sample_data = pulse_decay_case
+    duration = np.unique(np.concatenate([np.geomspace(1, df_100['Duration'].iloc[-1], 2000).round(2),
+                                         df_100['Duration']]))
+    df_fine = pd.DataFrame({'Duration': duration, 'Temperature': 298.15,
+                            'DateTime': pd.to_datetime(duration + 1.6e9, unit='s')})
+    for name in ['Inlet_Pressure', 'Outlet_Pressure']:
+        df_fine[name] = np.interp(duration, df_100['Duration'], df_100[name])
+    reference, _ = solve(df_fine, sample_data, SolverConfig(time_integration='bdf2'), monkeypatch)
+    index = np.searchsorted(duration, df_100['Duration'])
+    scale = df_100['Inlet_Pressure'].iloc[0] - df_100['Outlet_Pressure'].iloc[0]
+
+    def error(data):
+        return max(np.max(abs(data[f'{side}_pressure_calculated'] - reference[f'{side}_pressure_calculated'][index]))
+                   for side in ['inlet', 'outlet']) / scale
+
+    fixed, fixed_solves = solve(df_100, sample_data, SolverConfig(), monkeypatch)
+    adaptive, adaptive_solves = solve(df_100, sample_data,
+                                      SolverConfig(time_integration='bdf2', time_stepping='adaptive'), monkeypatch)
+    assert error(adaptive) < 3e-3 < error(fixed)
+    assert adaptive_solves < 0.9 * fixed_solves
+    assert adaptive['converged'].all()
+
+
+def test_adaptive_steps_need_bdf2():
+    with pytest.raises(ValueError, match='BDF2'):
+        dataclasses.replace(SolverConfig(), time_stepping='adaptive')
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import CoolProp.CoolProp as cp
+
+from gas_properties import PropertyTable
+
+
+@pytest.fixture
+def table_directory(tmp_path, monkeypatch):
+    # the tables are built for the test and not shared with other tests
+    monkeypatch.setattr(PropertyTable, 'directory', str(tmp_path))
+    monkeypatch.setattr(PropertyTable, 'tables', {})
+
+
+def props_si(gas, temperature, pressure):
+    return np.array(cp.PropsSI(PropertyTable.parameter, 'T', temperature, 'P', pressure, gas)).T
+
+
+# CO2 crosses the saturation pressure at 298.15 K, those intervals are evaluated exactly
+@pytest.mark.parametrize('gas', ['H2', 'CO2'])
+def test_table_is_within_its_tolerance(table_directory, gas):
+    table = PropertyTable.get(gas, 298.15)
+    pressure = np.random.default_rng(0).uniform(table.minimum_pressure, table.maximum_pressure, 2000)
+    expected = props_si(gas, 298.15, pressure)
+    relative_error = abs(table.lookup(pressure) - expected) / abs(expected)
+    assert relative_error.max() <= PropertyTable.relative_tolerance
+
+
+def test_pressures_outside_the_table_are_evaluated_exactly(table_directory):
+    table = PropertyTable.get('H2', 298.15)
+    pressure = np.array([1e4, 1e6, 8e7])
+    values = table.lookup(pressure)
+    np.testing.assert_array_equal(values[:, [0, 2]], props_si('H2', 298.15, pressure[[0, 2]]))
+    np.testing.assert_allclose(values[:, 1], props_si('H2', 298.15, pressure[1]), rtol=1e-6)
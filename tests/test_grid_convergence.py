@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from measurement import Measurement
+from settings import SolverConfig
+
+
+@pytest.fixture
+def measurement(tmp_path):
+    (tmp_path / 'sim_data').mkdir()
+    return Measurement(str(tmp_path / 'raw_data' / 'HY_S01.txt'), SolverConfig(), interactive=False)
+
+
+def time_refined_pressures(order):
+    # first and last cell of the pressures on 400, 200 and 100 time intervals with an error of that order
+    exact = np.array([40e5, 10e5])
+    return [exact + np.array([3e4, -2e4]) * (100 / intervals)**order for intervals in [400, 200, 100]]
+
+
+def test_time_refinement_ratio_counts_intervals(measurement, capsys):
+    df = measurement.grid_convergence(time_refined_pressures(1), [50] * 3, [401, 201, 101], 'a_time.csv', 'time')
+    np.testing.assert_allclose(df['order_of_convergence'], 1, rtol=1e-9)
+    np.testing.assert_allclose(df['p_exact'], [40e5, 10e5], rtol=1e-12)
+    assert 'Warning' not in capsys.readouterr().out
+
+
+def test_order_different_from_that_of_the_time_integration_is_reported(measurement, capsys):
+    measurement.grid_convergence(time_refined_pressures(2), [50] * 3, [401, 201, 101], 'a_time.csv', 'time')
+    assert 'Warning: the observed order of convergence 2.000 | 2.000 differs from the order 1' \
+        in capsys.readouterr().out
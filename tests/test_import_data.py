@@ -0,0 +1,56 @@
+import os
+import numpy as np
+import pytest
+
+import import_data
+from import_data import Data, DataReaktor
+from settings import SolverConfig
+from synthetic import SyntheticMeasurement
+
+
+def test_cached_channels_stay_on_their_memory_maps(tmp_path, monkeypatch):
+    path = SyntheticMeasurement('HY_S01', hours=1).write(str(tmp_path))
+    data = Data(path, SolverConfig(), interactive=False)
+    data.read_measurement_file()
+
+    memory_maps = {}
+    load = np.load
+
+    def load_and_keep(file, *args, **kwargs):
+        memory_maps[os.path.basename(file)[:-len('.npy')]] = array = load(file, *args, **kwargs)
+        return array
+    monkeypatch.setattr(import_data.np, 'load', load_and_keep)
+    df, index = data.load_raw_cache()
+
+    assert set(index['columns']) == set(memory_maps)
+    for column in index['columns']:
+        assert isinstance(memory_maps[column], np.memmap)
+        assert np.shares_memory(df[column].values, memory_maps[column]), column
+
+
+def test_file_without_a_complete_data_line(tmp_path):
+    path = SyntheticMeasurement('HY_S01', hours=1).write(str(tmp_path))
+    with open(path, 'rb') as file:
+        header = file.readline()
+        line = file.readline()
+    with open(path, 'wb') as file:
+        file.write(header + line[:len(line) // 2])
+    data = Data(path, SolverConfig(), interactive=False)
+    with pytest.raises(ValueError, match='no complete data line'):
+        data.read_measurement_file()
+
+
+@pytest.mark.parametrize('name, reaktor, k, hours, equilibrated', [
+    ('HY_S01', False, 2e-18, 24, True), ('HY_RV1', True, 2e-17, 24, True),
+    ('HY_S01', False, 2e-19, 3, False), ('HY_RV1', True, 2e-19, 3, False)])
+def test_interval_confidence(tmp_path, name, reaktor, k, hours, equilibrated):
+    path = SyntheticMeasurement(name, reaktor, k=k, hours=hours).write(str(tmp_path))
+    data = (DataReaktor if reaktor else Data)(path, SolverConfig(), interactive=False)
+    df = data.convert_units(data.read_measurement_file())
+    confidence = data.set_start_stop(df)
+
+    assert (confidence >= Data.minimum_confidence) == equilibrated
+    assert (data.stop < len(df)) == equilibrated
+    if equilibrated:
+        difference = (df['Inlet_Pressure'] - df['Outlet_Pressure']).values
+        assert abs(difference[data.stop - 100:data.stop].mean()) < 1e-3 * difference[data.start]
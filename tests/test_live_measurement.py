@@ -0,0 +1,51 @@
+import io
+import contextlib
+
+from import_data import Data
+from live_measurement import LiveMeasurement
+from synthetic import SyntheticMeasurement
+
+
+def test_rows_after_the_last_refit_are_fitted_on_close(tmp_path):
+    path = SyntheticMeasurement('HY_S01', hours=3, pulse=40, base_pressure=10).write(str(tmp_path / 'complete'))
+    with open(path) as file:
+        lines = file.readlines()
+    live_path = tmp_path / 'live' / 'raw_data' / 'HY_S01.txt'
+    live_path.parent.mkdir(parents=True)
+    live_path.write_text(''.join(lines[:len(lines) // 2]))
+
+    live = LiveMeasurement(str(live_path))
+    with contextlib.redirect_stdout(io.StringIO()):
+        # the first fit happens at once, the next one would only be due after a day
+        live.follow(poll_interval=0, refit_interval=86400, maximum_duration=0)
+        assert len(live.history) == 1
+        with open(live_path, 'a') as file:
+            file.writelines(lines[len(lines) // 2:])
+        history = live.close()
+
+    assert len(history) == 2
+    assert history['Duration'].iloc[1] > history['Duration'].iloc[0]
+    assert live.unfitted_rows == 0
+
+
+def test_repeated_and_unfinished_lines_are_left_out(tmp_path):
+    path = SyntheticMeasurement('HY_S01', hours=3, pulse=40, base_pressure=10).write(str(tmp_path / 'complete'))
+    with open(path) as file:
+        lines = file.readlines()
+    live_path = tmp_path / 'live' / 'raw_data' / 'HY_S01.txt'
+    live_path.parent.mkdir(parents=True)
+    half = len(lines) // 2
+    live_path.write_text(''.join(lines[:half]) + lines[half][:10])
+
+    live = LiveMeasurement(str(live_path))
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert live.update() == half - 1
+        # the logger finishes the line and repeats the last ones
+        with open(live_path, 'a') as file:
+            file.writelines([lines[half][10:]] + lines[half - 5:])
+        assert live.update() == len(lines) - half
+        assert live.update() == 0
+
+    expected, _ = Data.parse_raw_file(path)
+    assert (live.df['DateTime'].values == expected['DateTime'].values).all()
+    assert (live.df['Inlet_Pressure'].values == Data.convert_units(expected)['Inlet_Pressure'].values).all()
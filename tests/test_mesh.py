@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+from linear_system import LinearSystem
+from settings import SolverConfig
+
+
+@pytest.mark.parametrize('mesh', ['uniform', 'graded'])
+def test_sample_cells_span_the_sample_length(pulse_decay_case, mesh):
+    df_100, sample_data = pulse_decay_case
+    system = LinearSystem(df_100, sample_data, [1e-18, 0.05], SolverConfig(number_of_cells=30, mesh=mesh))
+    np.testing.assert_allclose(np.sum(system.cell_widths[1:-1]), sample_data['length'], rtol=1e-12)
+
+
+def test_original_spacing(pulse_decay_case):
+    df_100, sample_data = pulse_decay_case
+    system = LinearSystem(df_100, sample_data, [1e-18, 0.05], SolverConfig(number_of_cells=30, mesh='original'))
+    np.testing.assert_allclose(system.cell_widths, sample_data['length'] / 29, rtol=1e-12)
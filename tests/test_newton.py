@@ -0,0 +1,29 @@
+import numpy as np
+
+from linear_system import LinearSystem
+from settings import SolverConfig
+
+
+def test_newton_agrees_with_converged_picard(pulse_decay_case):
+    df_100, sample_data = pulse_decay_case
+    reference = LinearSystem(df_100, sample_data, [2e-18, 0.1],
+                             SolverConfig(nonlinear_tolerance=1e-10, maximum_iterations=1000)).solve_linear_system()
+    picard = LinearSystem(df_100, sample_data, [2e-18, 0.1]).solve_linear_system()
+    newton = LinearSystem(df_100, sample_data, [2e-18, 0.1],
+                          SolverConfig(nonlinear_solver='newton')).solve_linear_system()
+    assert reference['converged'].all() and newton['converged'].all()
+    np.testing.assert_allclose(newton['cell_pressure_history'], reference['cell_pressure_history'], rtol=1e-6)
+    assert newton['iterations'].sum() < picard['iterations'].sum()
+
+
+def test_newton_converges_where_picard_does_not(pulse_decay_case):
+    # CO2 at 51 bar and 298 K is close to condensation, its density changes too fast with the pressure for
+    # the fixed point iteration
+    df_100, sample_data = pulse_decay_case
+    sample_data = dict(sample_data, gas='CO2')
+    picard = LinearSystem(df_100, sample_data, [2e-18, 0.1]).solve_linear_system()
+    newton = LinearSystem(df_100, sample_data, [2e-18, 0.1],
+                          SolverConfig(nonlinear_solver='newton')).solve_linear_system()
+    assert not picard['converged'].all()
+    assert newton['converged'].all()
+    assert np.isfinite(newton['cell_pressure_history']).all()
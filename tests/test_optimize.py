@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+import scipy.optimize
+
+from gas_properties import PropertyError
+from linear_system import LinearSystem
+from optimize import Optimizer, SimplexBudget
+from settings import SolverConfig
+
+
+def exact_measurement(pulse_decay_case, guess=(2e-18, 0.1)):
+    # the measured pressures are those of the model itself
+    df_100, sample_data = pulse_decay_case
+    data = LinearSystem(df_100, sample_data, list(guess)).solve_linear_system()
+    df_100 = df_100.copy()
+    df_100['Inlet_Pressure'] = data['inlet_pressure_calculated']
+    df_100['Outlet_Pressure'] = data['outlet_pressure_calculated']
+    return df_100, sample_data
+
+
+def test_gradient_of_exact_fit_is_zero(pulse_decay_case):
+    df_100, sample_data = exact_measurement(pulse_decay_case)
+    optimizer = Optimizer(df_100, sample_data, [2e-18, 0.1])
+    error, gradient = optimizer.optimize_function_gradient(np.array([np.log10(2e-18), 0.1]), 'both')
+    assert error == 0
+    np.testing.assert_array_equal(gradient, [0, 0])
+
+
+def test_gradient_of_non_physical_candidate(pulse_decay_case, monkeypatch):
+    def fail(self, *args, **kwargs):
+        raise PropertyError('No outputs were able to be calculated')
+    monkeypatch.setattr(LinearSystem, 'solve_linear_system', fail)
+    optimizer = Optimizer(*pulse_decay_case, [2e-18, 0.1])
+    error, gradient = optimizer.optimize_function_gradient(np.array([np.log10(2e-18)]), 'k')
+    assert error == np.inf
+    np.testing.assert_array_equal(gradient, [0])
+
+
+def quadratic_objective(monkeypatch, minimum):
+    # a cheap error in log10(k) instead of the simulation, the rounds only depend on its values
+    def optimize_function_log(self, x, parameter):
+        return 1 + np.sum((x - minimum) ** 2)
+    monkeypatch.setattr(Optimizer, 'optimize_function_log', optimize_function_log)
+
+
+def test_multi_start_last_round_runs_until_convergence(pulse_decay_case, monkeypatch):
+    quadratic_objective(monkeypatch, np.log10(2e-18))
+    limits = []
+    minimize = scipy.optimize.minimize
+
+    def recording_minimize(*args, **kwargs):
+        limits.append((kwargs['options']['maxfev'], kwargs['options']['maxiter']))
+        return minimize(*args, **kwargs)
+    monkeypatch.setattr(scipy.optimize, 'minimize', recording_minimize)
+
+    optimizer = Optimizer(*pulse_decay_case, [2e-17, 0.1])
+    min_result, _ = optimizer.multi_start('k', number_of_starts=1, rounds=2, evaluations_per_round=3, workers=1)
+    assert limits == [(3, np.inf), (np.inf, np.inf)]
+    assert min_result.status == 0
+    np.testing.assert_allclose(min_result.x, [2e-18], rtol=1e-2)
+
+
+def test_multi_start_keeps_unconverged_starts_of_the_last_round(pulse_decay_case, monkeypatch):
+    quadratic_objective(monkeypatch, np.log10(2e-18))
+    optimizer = Optimizer(*pulse_decay_case, [2e-17, 0.1])
+    minimize = scipy.optimize.minimize
+
+    def limited_minimize(*args, **kwargs):
+        # every round stops before convergence
+        kwargs['options'] = dict(kwargs['options'], maxfev=3)
+        return minimize(*args, **kwargs)
+    monkeypatch.setattr(scipy.optimize, 'minimize', limited_minimize)
+
+    min_result, _ = optimizer.multi_start('k', number_of_starts=1, rounds=2, evaluations_per_round=3, workers=1)
+    assert min_result.status != 0
+    assert min_result.nfev == 6
+
+
+@pytest.mark.parametrize('function', [
+    lambda x: (1 - x[0]) ** 2 + 100 * (x[1] - x[0] ** 2) ** 2,
+    # flat steps, which make the simplex shrink
+    lambda x: np.floor(4 * np.sum(x ** 2))])
+def test_simplex_budget_follows_the_simplex_of_scipy(function):
+    simplex = SimplexBudget(3)
+
+    def objective(x):
+        value = function(x)
+        simplex.add(value)
+        return value
+    min_result = scipy.optimize.minimize(objective, [-1.2, 1], method='Nelder-Mead')
+    np.testing.assert_array_equal(simplex.values, min_result.final_simplex[1])
+
+
+def test_error_budget_keeps_the_path_of_the_fit(pulse_decay_case, capsys):
+    df_100, sample_data = exact_measurement(pulse_decay_case)
+    expected, _ = Optimizer(df_100, sample_data, [2e-17, 0.1]).nelder_mead('k')
+    capsys.readouterr()
+    min_result, _ = Optimizer(df_100, sample_data, [2e-17, 0.1], error_budget=1).nelder_mead('k')
+    assert capsys.readouterr().out.count('stopped after') > 0
+    assert (min_result.nit, min_result.nfev) == (expected.nit, expected.nfev)
+    np.testing.assert_array_equal(min_result.final_simplex[0], expected.final_simplex[0])
+    np.testing.assert_array_equal(min_result.final_simplex[1], expected.final_simplex[1])
+
+
+def test_other_errors_are_not_taken_for_a_non_physical_candidate(pulse_decay_case, monkeypatch):
+    def fail(self, *args, **kwargs):
+        raise ValueError('The adjoint gradient is only implemented for backward Euler with fixed time steps.')
+    monkeypatch.setattr(LinearSystem, 'solve_linear_system', fail)
+    optimizer = Optimizer(*pulse_decay_case, [2e-18, 0.1])
+    with pytest.raises(ValueError, match='adjoint'):
+        optimizer.optimize_function([2e-18, 0.1], 'both')
+
+
+@pytest.mark.parametrize('options, message', [({'mesh': 'regular'}, 'Unknown mesh'),
+                                              ({'linear_solver': 'lu'}, 'Unknown linear solver'),
+                                              ({'time_stepping': 'adaptive'}, 'BDF2'),
+                                              ({'mesh_stretching': 0}, 'stretching')])
+def test_configuration_is_checked_before_the_fit(options, message):
+    with pytest.raises(ValueError, match=message):
+        SolverConfig(**options)
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from linear_system import LinearSystem
+from optimize import Optimizer
+from settings import SolverConfig
+from simulation_cache import PrefixStore
+
+
+@pytest.mark.parametrize('time_integration', ['backward_euler', 'bdf2', 'crank_nicolson'])
+def test_continued_simulation_equals_full_simulation(pulse_decay_case, time_integration):
+    df_100, sample_data = pulse_decay_case
+    config = SolverConfig(time_integration=time_integration)
+    store = PrefixStore()
+    window = Optimizer(df_100.iloc[:60].copy(), sample_data, [2e-18, 0.1], config, prefix_store=store)
+    window.simulate([2e-18, 0.1])
+    optimizer = Optimizer(df_100, sample_data, [2e-18, 0.1], config, prefix_store=store)
+    data = optimizer.simulate([2e-18, 0.1])
+    expected = LinearSystem(df_100, sample_data, [2e-18, 0.1], config).solve_linear_system()
+
+    assert store.hits == 1
+    for name in ['inlet_pressure_calculated', 'outlet_pressure_calculated', 'cell_pressure', 'iterations']:
+        np.testing.assert_array_equal(data[name], expected[name])
+    # only the levels of the window before its end state are not kept
+    assert np.isnan(data['cell_pressure_history'][:58]).all()
+    np.testing.assert_array_equal(data['cell_pressure_history'][58:], expected['cell_pressure_history'][58:])
+
+
+def test_other_conditions_are_not_continued(pulse_decay_case):
+    df_100, sample_data = pulse_decay_case
+    store = PrefixStore()
+    Optimizer(df_100.iloc[:60].copy(), sample_data, [2e-18, 0.1], prefix_store=store).simulate([2e-18, 0.1])
+    df_100 = df_100.copy()
+    df_100.loc[80:, 'Temperature'] += 0.01
+    data = Optimizer(df_100, sample_data, [2e-18, 0.1], prefix_store=store).simulate([2e-18, 0.1])
+
+    assert store.hits == 0
+    assert not np.isnan(data['cell_pressure_history']).any()
+
+
+
+def test_windows_of_noisy_data_are_continued(pulse_decay_case):
+    # the mean temperature of every window differs on noisy data, the windows of a measurement share one
+    df_100, sample_data = pulse_decay_case
+    df_100 = df_100.copy()
+    df_100['Temperature'] += np.random.default_rng(0).normal(0, 0.05, len(df_100))
+    for temperature, hits in [(None, 0), (float(df_100['Temperature'].mean()), 1)]:
+        sample = dict(sample_data) if temperature is None else dict(sample_data, temperature=temperature)
+        store = PrefixStore()
+        Optimizer(df_100.iloc[:60].copy(), sample, [2e-18, 0.1], prefix_store=store).simulate([2e-18, 0.1])
+        data = Optimizer(df_100, sample, [2e-18, 0.1], prefix_store=store).simulate([2e-18, 0.1])
+        expected = LinearSystem(df_100, sample, [2e-18, 0.1]).solve_linear_system()
+        assert store.hits == hits
+        np.testing.assert_array_equal(data['cell_pressure'], expected['cell_pressure'])
+
+def test_shorter_window_is_not_continued(pulse_decay_case):
+    df_100, sample_data = pulse_decay_case
+    system = LinearSystem(df_100.iloc[:60], sample_data, [2e-18, 0.1])
+    store = PrefixStore()
+    key = store.key([2e-18, 0.1], system.get_conditions(), system.config)
+    store.put(key, LinearSystem(df_100, sample_data, [2e-18, 0.1]).solve_linear_system())
+    assert not system.is_prefix(store.get(key))
+
+
+def test_store_is_bounded(pulse_decay_case):
+    df_100, sample_data = pulse_decay_case
+    store = PrefixStore(maximum_entries=2)
+    optimizer = Optimizer(df_100.iloc[:10].copy(), sample_data, [2e-18, 0.1], prefix_store=store)
+    for k in [1e-18, 2e-18, 3e-18]:
+        optimizer.simulate([k, 0.1])
+    assert [key[0] for key in store.memory] == [2e-18, 3e-18]
@@ -0,0 +1,54 @@
+import threading
+import numpy as np
+import pytest
+
+from import_data import Data
+from linear_system import LinearSystem
+from profiling import Profiler, active_profiler
+from settings import SolverConfig
+from synthetic import SyntheticMeasurement
+
+guess = [1e-18, 0.05]
+
+
+def test_only_the_profiled_thread_is_measured(pulse_decay_case):
+    df_100, sample_data = pulse_decay_case
+    other = threading.Thread(target=lambda: [LinearSystem(df_100, sample_data, guess).solve_linear_system()
+                                             for _ in range(3)])
+    with Profiler() as profiler:
+        other.start()
+        data = LinearSystem(df_100, sample_data, guess).solve_linear_system()
+        other.join()
+
+    assert profiler.timings['forward_solve'][0] == 1
+    steps = profiler.step_table()
+    np.testing.assert_array_equal(steps['nonlinear_iterations'], data['iterations'])
+    assert steps['converged'].all()
+
+
+def test_a_failing_fit_leaves_no_profiler_behind(pulse_decay_case):
+    df_100, sample_data = pulse_decay_case
+    sample_data = dict(sample_data, gas='unknown')
+    with pytest.raises(ValueError):
+        with Profiler():
+            LinearSystem(df_100, sample_data, guess, SolverConfig(property_backend='coolprop')).solve_linear_system()
+    assert active_profiler.get() is None
+    with Profiler() as profiler:
+        pass
+    assert profiler.timings == {}
+
+
+def test_tables_are_written_to_separate_files(tmp_path, pulse_decay_case):
+    df_100, sample_data = pulse_decay_case
+    path = SyntheticMeasurement('HY_S01', hours=1).write(str(tmp_path))
+    data = Data(path, SolverConfig(), interactive=False)
+    df_100, df_final = data.new_pressure_file()
+    df_final.to_csv(path[:-len('.txt')] + '_adjusted.csv', index=False)
+    with Profiler() as profiler:
+        data.adjusted_pressure_file()
+        LinearSystem(df_100, sample_data, guess).solve_linear_system()
+    assert profiler.timings['data_loading'][0] == 1
+
+    profiler.to_csv(str(tmp_path / 'profile'))
+    for table in ['sections', 'solves', 'steps']:
+        assert (tmp_path / f'profile_{table}.csv').exists()
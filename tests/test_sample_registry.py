@@ -0,0 +1,21 @@
+import shutil
+
+from sample_registry import SampleRegistry
+
+
+def test_invalid_rows_are_skipped(tmp_path, capsys):
+    for file in SampleRegistry.files.values():
+        shutil.copy(file, tmp_path / file)
+    with open(tmp_path / 'database.csv', 'a') as file:
+        file.write('HY_BAD_UNIT 01.01.2021 02.01.2021 0.2 0.1 99 H2 8 salt 200e5*0.0055 60e5*0.0055\n')
+        file.write('HY_BAD_LENGTH 01.01.2021 02.01.2021 -0.2 0.1 8 H2 8 salt 200e5*0.0055 60e5*0.0055\n')
+        file.write('HY_BAD_SENSOR 01.01.2021 02.01.2021 0.2 0.1 8 H2 8 salt 200e5 60e5*0.0055\n')
+
+    registry = SampleRegistry(str(tmp_path))
+    output = capsys.readouterr().out
+    reference = SampleRegistry.get()
+
+    for name in ['HY_BAD_UNIT', 'HY_BAD_LENGTH', 'HY_BAD_SENSOR']:
+        assert name not in registry.cores
+        assert f'{name} is skipped' in output
+    assert registry.names() == reference.names()
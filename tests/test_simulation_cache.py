@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from simulation_cache import SimulationCache
+
+
+@pytest.mark.parametrize('directory', [None, 'disk'])
+def test_hits_cannot_change_the_entry(tmp_path, directory):
+    cache = SimulationCache(directory=None if directory is None else str(tmp_path))
+    data = {'cell_pressure': np.ones(3), 'aborted': False}
+    cache.put('key', data)
+    # the caller keeps its own writable arrays
+    data['cell_pressure'][0] = 5
+
+    if directory is not None:
+        cache.memory.clear()
+    hit = cache.get('key')
+    hit['aborted'] = True
+    with pytest.raises(ValueError):
+        hit['cell_pressure'][0] = 2
+
+    np.testing.assert_array_equal(cache.get('key')['cell_pressure'], np.ones(3))
+    assert not cache.get('key')['aborted']
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from import_data import Data
+from measurement import Measurement
+from optimize import Optimizer
+from pulse_decay import estimate_parameters
+from settings import SolverConfig
+from synthetic import SyntheticMeasurement
+
+
+# the default grid of the fits is coarser than the one of the generator (100 cells, 400 steps), which leaves
+# a discretisation bias of about 2 % in k; on the grid of the generator only the noise remains
+@pytest.mark.parametrize('config, tolerance', [(SolverConfig(), 0.03),
+                                               (SolverConfig(number_of_cells=100, number_of_time_steps=400), 0.005)])
+def test_permeability_is_recovered(tmp_path, config, tolerance):
+    measurement = SyntheticMeasurement('HY_S01', k=2e-18, n=0.1, pulse=40, base_pressure=10, hours=6)
+    data = Data(measurement.write(str(tmp_path)), config, interactive=False)
+    df_100, _ = data.new_pressure_file()
+    sample_data = data.sample_data()
+    assert data.start == measurement.lead_time
+
+    guess = [estimate_parameters(df_100, sample_data)[0], measurement.n]
+    result, _ = Optimizer(df_100, sample_data, guess, config).nelder_mead('k')
+    assert abs(result.x[0] / measurement.k - 1) < tolerance
+
+
+def test_multilevel_fit_sets_the_interval_once(tmp_path, monkeypatch):
+    measurement = SyntheticMeasurement('HY_S01', k=2e-18, n=0.1, pulse=40, base_pressure=10, hours=6)
+    path = measurement.write(str(tmp_path))
+    intervals = []
+    adjust_measurement_interval = Data.adjust_measurement_interval
+
+    def counting_adjust_measurement_interval(self, df):
+        intervals.append(self.config)
+        return adjust_measurement_interval(self, df)
+    monkeypatch.setattr(Data, 'adjust_measurement_interval', counting_adjust_measurement_interval)
+
+    sample_data = Measurement(path, interactive=False).calculate_permeability_multilevel([6e-18, 0.1], 'k')
+    assert len(intervals) == 1
+    # the finest level has 100 cells like the generator, but half of its time steps
+    assert abs(sample_data['k'] / measurement.k - 1) < 0.01
+    assert (tmp_path / 'sim_data' / 'HY_S01.csv').exists()
+
+
+def test_error_scan_has_its_minimum_at_the_permeability(tmp_path):
+    measurement = SyntheticMeasurement('HY_S01', k=2e-18, n=0.1, pulse=40, base_pressure=10, hours=6)
+    df_scan = Measurement(measurement.write(str(tmp_path)), interactive=False).calculate_error_scan(
+        np.geomspace(5e-19, 8e-18, 13), [0.1], batch_size=5)
+    assert len(df_scan) == 13
+    assert df_scan.loc[df_scan['e'].idxmin(), 'k'] == pytest.approx(2e-18, rel=0.3)
+    assert (tmp_path / 'sim_data' / 'HY_S01_scan.csv').exists()
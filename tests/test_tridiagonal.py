@@ -0,0 +1,84 @@
+import dataclasses
+import numpy as np
+import pytest
+import scipy.sparse
+import scipy.sparse.linalg
+
+import tridiagonal
+from linear_system import LinearSystem, BatchLinearSystem
+from settings import SolverConfig
+
+
+def spsolve(lower, diagonal, upper, rhs):
+    # the path of the original model: CSR matrix and spsolve
+    matrix = scipy.sparse.diags([diagonal, lower, upper], [0, -1, 1], format='csr')
+    return scipy.sparse.linalg.spsolve(matrix, rhs)
+
+
+@pytest.mark.parametrize('number_of_cells', [3, 50, 400])
+def test_random_diagonally_dominant_system(number_of_cells):
+    random = np.random.default_rng(number_of_cells)
+    lower = random.uniform(-1, 1, number_of_cells - 1)
+    upper = random.uniform(-1, 1, number_of_cells - 1)
+    diagonal = (2 + random.uniform(0, 1, number_of_cells)) * random.choice([-1, 1], number_of_cells)
+    rhs = random.normal(size=number_of_cells)
+    expected = spsolve(lower, diagonal, upper, rhs)
+
+    for solve in [tridiagonal.solve_banded, tridiagonal.solve_thomas]:
+        np.testing.assert_allclose(solve(lower, diagonal, upper, rhs.copy()), expected, rtol=1e-12)
+
+
+def test_singular_system():
+    with pytest.raises(np.linalg.LinAlgError):
+        tridiagonal.solve_banded(np.zeros(2), np.zeros(3), np.zeros(2), np.ones(3))
+
+
+@pytest.mark.parametrize('linear_solver', ['banded', 'thomas', 'sparse'])
+def test_linear_system_step(pulse_decay_case, linear_solver):
+    df_100, sample_data = pulse_decay_case
+    config = SolverConfig(linear_solver=linear_solver)
+    system = LinearSystem(df_100, sample_data, [2e-18, 0.1], config)
+    system.calculate_timesteps()
+    system.data['actual_time_step'] = 0
+    sample_pressure = system.get_initial_pressure()
+    solution_vector = system.get_right_hand_side(sample_pressure).copy()
+    main_diagonal, off_diagonal, _ = system.build_diagonals(sample_pressure)
+    expected = spsolve(off_diagonal.copy(), main_diagonal.copy(), off_diagonal.copy(), solution_vector)
+
+    coefficient_matrix, _ = system.get_linear_system(sample_pressure)
+    np.testing.assert_allclose(system.solve(coefficient_matrix, solution_vector), expected, rtol=1e-12)
+
+
+def test_forward_solve_agrees_with_sparse(pulse_decay_case):
+    df_100, sample_data = pulse_decay_case
+    config = SolverConfig(linear_solver='sparse')
+    expected = LinearSystem(df_100, sample_data, [2e-18, 0.1], config).solve_linear_system()['cell_pressure_history']
+    for linear_solver in ['banded', 'thomas']:
+        data = LinearSystem(df_100, sample_data, [2e-18, 0.1],
+                            dataclasses.replace(config, linear_solver=linear_solver)).solve_linear_system()
+        np.testing.assert_allclose(data['cell_pressure_history'], expected, rtol=1e-12)
+
+
+def test_coefficients_are_not_overwritten_by_later_calls(pulse_decay_case):
+    df_100, sample_data = pulse_decay_case
+    system = LinearSystem(df_100, sample_data, [2e-18, 0.1])
+    system.calculate_timesteps()
+    system.data['actual_time_step'] = 0
+    sample_pressure = system.get_initial_pressure()
+    main_diagonal, off_diagonal, storage = system.build_diagonals(sample_pressure)
+    kept = [array.copy() for array in (main_diagonal, off_diagonal, storage)]
+    system.build_diagonals(sample_pressure * 1.5)
+    system.get_newton_system(sample_pressure * 2, system.get_right_hand_side(sample_pressure * 2))
+    for array, copy in zip((main_diagonal, off_diagonal, storage), kept):
+        np.testing.assert_array_equal(array, copy)
+
+
+def test_batch_agrees_with_single_solves(pulse_decay_case):
+    # a converged batch, the candidates that converge first are iterated further with the others
+    df_100, sample_data = pulse_decay_case
+    config = SolverConfig(nonlinear_tolerance=1e-10, maximum_iterations=1000)
+    guesses = [[5e-19, 0.05], [2e-18, 0.1], [1e-17, 0.2], [4e-17, 0.3]]
+    batch = BatchLinearSystem(df_100, sample_data, guesses, config).solve_linear_system()
+    for guess, pressure_history in zip(guesses, batch['cell_pressure_history']):
+        expected = LinearSystem(df_100, sample_data, guess, config).solve_linear_system()['cell_pressure_history']
+        np.testing.assert_allclose(pressure_history, expected, rtol=1e-8)
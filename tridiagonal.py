@@ -0,0 +1,34 @@
+import numpy as np
+import scipy.linalg.lapack
+
+gtsv = scipy.linalg.lapack.get_lapack_funcs('gtsv', dtype=np.float64)
+
+
+def solve_banded(lower, diagonal, upper, rhs):
+    # LAPACK gtsv, which scipy.linalg.solve_banded calls for tridiagonal systems, without building the
+    # banded matrix and validating the input on every call
+    _, _, _, solution, info = gtsv(lower, diagonal, upper, rhs)
+    if info > 0:
+        raise np.linalg.LinAlgError('singular matrix')
+    return solution
+
+
+def solve_thomas(lower, diagonal, upper, rhs):
+    # operates on the last axis, so a leading batch dimension is solved in the same sweep
+    diagonal, rhs = np.broadcast_arrays(diagonal, rhs)
+    number_of_cells = diagonal.shape[-1]
+    upper_modified = np.empty(diagonal.shape[:-1] + (number_of_cells - 1,))
+    rhs_modified = np.empty(diagonal.shape)
+
+    upper_modified[..., 0] = upper[..., 0] / diagonal[..., 0]
+    rhs_modified[..., 0] = rhs[..., 0] / diagonal[..., 0]
+    for i in range(1, number_of_cells):
+        denominator = diagonal[..., i] - lower[..., i-1] * upper_modified[..., i-1]
+        if i < number_of_cells - 1:
+            upper_modified[..., i] = upper[..., i] / denominator
+        rhs_modified[..., i] = (rhs[..., i] - lower[..., i-1] * rhs_modified[..., i-1]) / denominator
+
+    solution = rhs_modified
+    for i in range(number_of_cells - 2, -1, -1):
+        solution[..., i] -= upper_modified[..., i] * solution[..., i+1]
+    return solution